@@ -3,6 +3,9 @@ import marimo
 __generated_with = "0.23.1"
 app = marimo.App()
 
+with app.setup:
+    import polars as pl
+
 
 @app.cell(hide_code=True)
 def _(mo):
@@ -24,34 +27,125 @@ def _(mo):
 
 
 @app.cell
-def _(load_data):
-    df = load_data()
-    return (df,)
+def _(load_data, proxied, with_atlas):
+    data, load_timings = load_data()
+    df = with_atlas(
+        data.with_columns(proxied("thumbnail"), proxied("iiif_url"))
+    )
+    return df, load_timings
+
+
+@app.cell(hide_code=True)
+def _(load_timings, mo):
+    mo.accordion({"Load timings (seconds)": mo.ui.table(load_timings)})
+    return
 
 
 @app.cell(hide_code=True)
 def _():
-    import polars as pl
     import marimo as mo
+    import os
     import pathlib
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import httpx
+
+    NGA_TABLES = {
+        "objects": {"infer_schema_length": 10000},
+        "constituents": {"infer_schema_length": 10000},
+        "objects_constituents": {
+            "infer_schema_length": 10000,
+            "schema_overrides": {"zipcode": pl.Utf8},
+        },
+        "published_images": {"infer_schema_length": 10000},
+    }
+
+
+    def fetch_tables(
+        base: str, tables: dict[str, dict] = NGA_TABLES
+    ) -> tuple[dict[str, pl.DataFrame], dict[str, dict[str, float]]]:
+        """Download and parse the source tables concurrently.
+
+        All requests share one connection pool. Returns the parsed frames and
+        per-table ``fetch``/``parse`` timings in seconds.
+        """
+
+        def fetch(client: httpx.Client, name: str):
+            start = time.perf_counter()
+            response = client.get(f"{base}/{name}.csv")
+            response.raise_for_status()
+            fetched = time.perf_counter()
+            frame = pl.read_csv(response.content, **tables[name])
+            parsed = time.perf_counter()
+            return name, frame, {"fetch": fetched - start, "parse": parsed - fetched}
+
+        with (
+            httpx.Client(follow_redirects=True, timeout=120) as client,
+            ThreadPoolExecutor(max_workers=len(tables)) as pool,
+        ):
+            results = list(pool.map(lambda name: fetch(client, name), tables))
+
+        frames = {name: frame for name, frame, _ in results}
+        timings = {name: timing for name, _, timing in results}
+        return frames, timings
+
+
+    # local caching image proxy, see scripts/image_proxy.py
+    IMAGE_PROXY = os.environ.get("NGA_IMAGE_PROXY")
+
+
+    def proxied(column: str) -> pl.Expr:
+        """Rewrite the URLs in ``column`` to go through ``IMAGE_PROXY``, if set."""
+        if not IMAGE_PROXY:
+            return pl.col(column)
+        prefix = IMAGE_PROXY.rstrip("/") + "/"
+        return pl.concat_str(
+            pl.lit(prefix),
+            pl.col(column).str.replace("://", "/", literal=True),
+        ).alias(column)
+
+
+    # sprite atlases built by scripts/atlas.py, served by the image proxy
+    ATLAS_DIR = os.environ.get("NGA_ATLAS_DIR")
+
+
+    def with_atlas(data: pl.DataFrame) -> pl.DataFrame:
+        """Attach each artwork's sprite atlas location, if atlases are set up."""
+        if not (ATLAS_DIR and IMAGE_PROXY):
+            return data
+        atlas_url = IMAGE_PROXY.rstrip("/") + "/atlas/"
+        index = pl.read_parquet(pathlib.Path(ATLAS_DIR) / "atlas.parquet")
+        return data.join(
+            index.with_columns(
+                pl.concat_str(pl.lit(atlas_url), "atlas").alias("atlas")
+            ),
+            on="objectid",
+            how="left",
+        )
+
+
+    # normalized embeddings from scripts/similarity_index.py
+    EMBEDDINGS_DIR = os.environ.get("NGA_EMBEDDINGS_DIR")
 
 
     @mo.persistent_cache
     def load_data(
         base="https://raw.githubusercontent.com/NationalGalleryOfArt/opendata/main/data",
-    ) -> pl.DataFrame:
-        objects = pl.read_csv(f"{base}/objects.csv", infer_schema_length=10000)
-        constituents = pl.read_csv(
-            f"{base}/constituents.csv", infer_schema_length=10000
-        )
-        obj_constituents = pl.read_csv(
-            f"{base}/objects_constituents.csv",
-            infer_schema_length=10000,
-            schema_overrides={"zipcode": pl.Utf8},
-        )
-        images = pl.read_csv(
-            f"{base}/published_images.csv", infer_schema_length=10000
+    ) -> tuple[pl.DataFrame, pl.DataFrame]:
+        """The joined artwork frame and the per-table fetch/parse timings.
+
+        The timings are cached with the data, so they describe the load that
+        produced it.
+        """
+        tables, timings = fetch_tables(base)
+        timings = pl.DataFrame(
+            [{"table": name, **timing} for name, timing in timings.items()]
         )
+        objects = tables["objects"]
+        constituents = tables["constituents"]
+        obj_constituents = tables["objects_constituents"]
+        images = tables["published_images"]
         artists = (
             obj_constituents.filter(pl.col("roletype") == "artist")
             .sort("displayorder")
@@ -68,24 +162,10 @@ def _():
             .select("objectid", "artist", "artist_nationality")
         )
 
-        thumbnails = (
-            images.filter(
-                (pl.col("viewtype") == "primary") & (pl.col("sequence") == 0)
-            )
-            .group_by("depictstmsobjectid")
-            .first()
-            .select(
-                pl.col("depictstmsobjectid").alias("objectid"),
-                pl.col("iiifthumburl").alias("thumbnail"),
-                pl.col("iiifurl").alias("iiif_url"),
-                "width",
-                "height",
-                pl.col("openaccess").alias("public_domain"),
-            )
-        )
+        thumbnails = primary_thumbnails(images)
         tsne = pl.read_parquet(pathlib.Path(__file__).parent / "tsne.parquet")
 
-        return (
+        data = (
             objects.select(
                 "objectid",
                 "title",
@@ -104,6 +184,7 @@ def _():
             )
             .with_columns(pl.col("public_domain").cast(pl.Boolean))
             .select(
+                "objectid",
                 "thumbnail",
                 "iiif_url",
                 "title",
@@ -120,8 +201,36 @@ def _():
                 "y",
             )
         )
+        return data, timings
+
+    return EMBEDDINGS_DIR, load_data, mo, pathlib, proxied, with_atlas
+
+
+@app.function
+def primary_thumbnails(
+    images: pl.DataFrame | pl.LazyFrame,
+) -> pl.DataFrame | pl.LazyFrame:
+    """Pick each artwork's primary image from the ``published_images`` table.
 
-    return load_data, mo, pl
+    Works on eager and lazy frames alike. Shared with
+    ``scripts/download_list.py``, which builds the downloader's input from
+    the same selection.
+    """
+    return (
+        images.filter(
+            (pl.col("viewtype") == "primary") & (pl.col("sequence") == 0)
+        )
+        .group_by("depictstmsobjectid")
+        .first()
+        .select(
+            pl.col("depictstmsobjectid").alias("objectid"),
+            pl.col("iiifthumburl").alias("thumbnail"),
+            pl.col("iiifurl").alias("iiif_url"),
+            "width",
+            "height",
+            pl.col("openaccess").alias("public_domain"),
+        )
+    )
 
 
 @app.cell(hide_code=True)
@@ -133,14 +242,94 @@ def _(mo):
 
 
 @app.cell
-def _(df):
+def _(Cube, df):
+    cube = Cube.from_frame(df)
+    return (cube,)
+
+
+@app.cell(hide_code=True)
+def _():
+    class Cube:
+        """Artwork counts for a few small groupings, one per chart.
+
+        Each grouping (type × public, artist × public, ...) is counted
+        separately, so its size follows the number of bars in a chart rather
+        than the number of artworks. (A single cube over every dimension
+        has close to one cell per artwork and saves little over the frame.)
+        Charts aggregate these counts instead of the full frame, and filters
+        that only reference a grouping's dimensions are applied to its counts
+        directly.
+        """
+
+        GROUPINGS = (
+            ("type", "public"),
+            ("artist", "public"),
+            ("artist_nationality", "public"),
+            ("decade", "public"),
+        )
+
+        def __init__(self, counts: dict[tuple[str, ...], pl.DataFrame]):
+            self.counts = counts
+
+        @staticmethod
+        def with_decade(data: pl.DataFrame) -> pl.DataFrame:
+            """``data`` with the derived ``decade`` dimension, if it lacks one."""
+            if "decade" in data.columns:
+                return data
+            return data.with_columns(
+                (pl.col("beginyear") // 10 * 10).alias("decade")
+            )
+
+        @classmethod
+        def from_frame(cls, data: pl.DataFrame, groupings=GROUPINGS) -> "Cube":
+            data = cls.with_decade(data)
+            return cls(
+                {
+                    tuple(grouping): data.group_by(grouping).len()
+                    for grouping in groupings
+                }
+            )
+
+        def filter(self, predicate: pl.Expr, data: pl.DataFrame) -> "Cube":
+            """Cube for ``data.filter(predicate)``, reusing counts when possible."""
+            roots = set(predicate.meta.root_names())
+            counts = {
+                grouping: cube.filter(predicate)
+                for grouping, cube in self.counts.items()
+                if roots <= set(grouping)
+            }
+            rest = [grouping for grouping in self.counts if grouping not in counts]
+            if rest:
+                # the predicate may reference derived dimensions such as decade
+                data = Cube.with_decade(data).filter(predicate)
+                counts |= Cube.from_frame(data, rest).counts
+            return Cube(counts)
+
+        def rollup(self, *dimensions: str) -> pl.DataFrame:
+            """Total counts grouped by ``dimensions``, from the smallest
+            grouping that covers them."""
+            candidates = [
+                cube
+                for grouping, cube in self.counts.items()
+                if set(dimensions) <= set(grouping)
+            ]
+            if not candidates:
+                raise KeyError(f"no grouping covers {dimensions}")
+            cube = min(candidates, key=lambda cube: cube.height)
+            return cube.group_by(dimensions).agg(pl.col("len").sum())
+
+    return (Cube,)
+
+
+@app.cell
+def _(cube):
     import altair as alt
 
     alt.data_transformers.enable("vegafusion")
 
-    alt.Chart(df).mark_bar().encode(
+    alt.Chart(cube.rollup("type", "public")).mark_bar().encode(
         x=alt.X("type", sort="-y", title="Type"),
-        y=alt.Y("count()", title="Count"),
+        y=alt.Y("len", title="Count"),
         color=alt.Color("public", title="Public domain"),
     )
     return (alt,)
@@ -163,19 +352,20 @@ def _(mo):
 
 
 @app.cell
-def _(df):
+def _(cube, df):
     # full dataset
-    subset = df
+    subset_filter = pl.lit(True)
     # just the paintings
-    # _subset = df.filter(pl.col("type") == "painting")
-    return (subset,)
+    # subset_filter = pl.col("type") == "painting"
+    subset = df.filter(subset_filter)
+    subset_cube = cube.filter(subset_filter, df)
+    return subset, subset_cube
 
 
 @app.cell
-def _(alt, subset):
+def _(alt, subset_cube):
     alt.Chart(
-        subset.group_by("artist", "public")
-        .len()
+        subset_cube.rollup("artist", "public")
         .sort("len", descending=True)
         .head(15)
     ).mark_bar().encode(
@@ -214,48 +404,229 @@ def _(mo):
 
 
 @app.cell
-def _(GalleryWidget, pl, subset):
+def _(GalleryWidget, subset):
     GalleryWidget(
         data=subset.filter(pl.col("public")).sample(500, seed=42), page_size=15
     )
     return
 
 
+@app.function
+def encode_ipc(
+    frame: pl.DataFrame,
+    columns: list[str] | None = None,
+    *,
+    compression: str = "uncompressed",
+) -> bytes:
+    """Serialize ``frame`` as an Arrow IPC payload for a widget.
+
+    Projects to ``columns`` and dictionary-encodes string columns whose
+    values repeat enough for a dictionary to be smaller than the raw strings.
+    """
+    if columns is not None:
+        frame = frame.select(columns)
+    frame = frame.with_columns(
+        pl.col(name).cast(pl.Categorical)
+        for name, dtype in frame.schema.items()
+        if dtype == pl.String
+        and 2 * frame.get_column(name).n_unique() <= frame.height
+    )
+    buf = frame.write_ipc(None, compression=compression)
+    assert buf is not None
+    return buf.getvalue()
+
+
 @app.cell(hide_code=True)
-def _(pl):
+def _():
     import anywidget
+    import numpy as np
     import traitlets
 
 
     class GalleryWidget(anywidget.AnyWidget):
-        """Paginated mosaic gallery with multi-select and right-click detail."""
+        """Paginated mosaic gallery with multi-select and right-click detail.
+
+        The frame stays in Python. The browser requests pages as it needs
+        them (plus ``prefetch`` pages ahead) and receives each one as a small
+        IPC buffer holding only the ``columns`` the renderer reads. Rows
+        with an ``atlas`` are drawn from their sprite atlas image.
+        ``show`` narrows the gallery to a subset of rows. With
+        ``mode="scroll"`` pages are appended as you scroll, and card nodes
+        are recycled as they leave the viewport. ``selected`` holds the
+        selected object IDs as a sorted int32 array, so a selection survives
+        ``show`` and re-sampling; ``select`` sets it. If ``similar`` is given
+        (object IDs -> frame with ``objectid`` ranked by similarity), the
+        right-click detail offers "Similar artworks", which shows the
+        neighbours of the clicked or selected artworks, and "More like
+        these" searches with every artwork in the current view.
+        """
 
-        _data = traitlets.Any(b"").tag(sync=True)
-        selected = traitlets.List([]).tag(sync=True)
+        columns = (
+            "objectid",
+            "thumbnail",
+            "iiif_url",
+            "title",
+            "artist",
+            "date",
+            "medium",
+            "type",
+            "width",
+            "height",
+            "atlas",
+            "atlas_size",
+            "sprite_x",
+            "sprite_y",
+            "sprite_w",
+            "sprite_h",
+        )
+
+        num_rows = traitlets.Int(0).tag(sync=True)
+        selected = traitlets.Any(np.zeros(0, np.int32))
         page_size = traitlets.Int(60).tag(sync=True)
+        prefetch = traitlets.Int(1).tag(sync=True)
+        mode = traitlets.Enum(["pages", "scroll"], "pages").tag(sync=True)
+        compression = traitlets.Enum(
+            ["uncompressed", "lz4", "zstd"], "uncompressed"
+        ).tag(sync=True)
+        _view = traitlets.Int(0).tag(sync=True)
+        _searchable = traitlets.Bool(False).tag(sync=True)
+        # ``selected`` as bytes, mirrored to the browser
+        _selected = traitlets.Bytes(b"").tag(sync=True)
 
-        def __init__(self, data: pl.DataFrame, **kwargs):
-            buf = data.write_ipc(None)
-            assert buf is not None
-            kwargs["_data"] = buf.getvalue()
+        def __init__(
+            self, data: pl.DataFrame, indices=None, *, similar=None, **kwargs
+        ):
             super().__init__(**kwargs)
+            self._frame = data
+            self._similar = similar
+            self._searchable = similar is not None
+            self.observe(self._sync_selected, names=["selected"])
+            self.on_msg(self._handle_message)
+            self.show(indices)
+
+        def select(self, object_ids) -> None:
+            """Select the artworks with ``object_ids``."""
+            self.selected = np.unique(np.asarray(object_ids, dtype=np.int32))
+
+        def _sync_selected(self, change) -> None:
+            self._selected = change["new"].tobytes()
+
+        def show(self, indices=None) -> None:
+            """Display only the rows at ``indices``, or every row if None."""
+            if indices is None:
+                self._rows = np.arange(self._frame.height, dtype=np.uint32)
+            else:
+                self._rows = np.asarray(indices, dtype=np.uint32)
+            with self.hold_sync():
+                self.num_rows = len(self._rows)
+                self._view += 1
+
+        def page(self, page: int) -> pl.DataFrame:
+            """Rows on ``page`` of the current view."""
+            start = page * self.page_size
+            return self._frame[self._rows[start : start + self.page_size]]
+
+        def rows_for(self, object_ids) -> np.ndarray:
+            """Frame rows holding ``object_ids``, in the order given."""
+            return (
+                pl.DataFrame({"objectid": object_ids})
+                .cast({"objectid": self._frame.schema["objectid"]})
+                .join(
+                    self._frame.select("objectid").with_row_index("_row"),
+                    on="objectid",
+                    maintain_order="left",
+                )
+                .get_column("_row")
+                .to_numpy()
+            )
+
+        def _show_similar(self, object_ids: list[int] | None) -> None:
+            if object_ids is None:
+                ids = self._frame.get_column("objectid").gather(self._rows)
+                object_ids = ids.to_list()
+            neighbours = self._similar(object_ids)
+            self.show(self.rows_for(neighbours.get_column("objectid")))
+
+        def _handle_message(self, _, content, buffers) -> None:
+            kind = content.get("type")
+            if kind == "select":
+                payload = buffers[0] if buffers else b""
+                self.select(np.frombuffer(payload, dtype=np.int32))
+                return
+            if kind == "similar" and self._similar is not None:
+                self._show_similar(content["ids"])
+                return
+            if kind != "pages" or content["view"] != self._view:
+                return
+            columns = [
+                name for name in self.columns if name in self._frame.columns
+            ]
+            for page in content["pages"]:
+                payload = encode_ipc(
+                    self.page(page), columns, compression=self.compression
+                )
+                self.send(
+                    {"type": "page", "view": self._view, "page": page},
+                    buffers=[payload],
+                )
 
         _esm = """
-    import { tableFromIPC } from "https://esm.sh/@uwdata/flechette@2";
+    import {
+      tableFromIPC, setCompressionCodec, CompressionType,
+    } from "https://esm.sh/@uwdata/flechette@2";
+    const CODECS = {
+      lz4: [CompressionType.LZ4_FRAME, "https://esm.sh/lz4js@0.2.0"],
+      zstd: [CompressionType.ZSTD, "https://esm.sh/fzstd@0.1.1"],
+    };
+    async function loadCodec(name) {
+      if (!(name in CODECS)) return;
+      const [type, url] = CODECS[name];
+      const { decompress } = await import(url);
+      setCompressionCodec(type, { decode: (bytes) => decompress(bytes) });
+    }
+    // Selections travel as sorted int32 object ID buffers.
+    function decodeIds(value) {
+      if (!value || !value.byteLength) return new Int32Array(0);
+      const bytes = new Uint8Array(value.buffer ?? value, value.byteOffset ?? 0, value.byteLength);
+      return new Int32Array(bytes.slice().buffer);
+    }
     function render({ model, el }) {
       const controller = new AbortController();
       const { signal } = controller;
+      let selected = new Set(decodeIds(model.get("_selected")));
+      let codecReady = loadCodec(model.get("compression"));
       let currentPage = 0;
-      let table = null;
-      function parseTable() {
-        const buf = model.get("_data");
-        if (buf && buf.byteLength) {
-          table = tableFromIPC(new Uint8Array(buf.buffer));
+      let view = model.get("_view");
+      const pages = new Map();
+      const pending = new Set();
+      const blocks = new Map();
+      const visible = new Set();
+      const pool = [];
+      const ROW_H = 8;
+      const GAP = 6;
+      function numRows() { return model.get("num_rows"); }
+      function totalPages() {
+        return Math.max(1, Math.ceil(numRows() / model.get("page_size")));
+      }
+      function scrolling() { return model.get("mode") === "scroll"; }
+      function resetPages() {
+        view = model.get("_view");
+        pages.clear();
+        pending.clear();
+        currentPage = 0;
+      }
+      function requestPages(first) {
+        const last = Math.min(first + model.get("prefetch"), totalPages() - 1);
+        const wanted = [];
+        for (let p = first; p <= last; p++) {
+          if (!pages.has(p) && !pending.has(p)) { pending.add(p); wanted.push(p); }
         }
+        if (wanted.length) model.send({ type: "pages", view, pages: wanted });
       }
       const style = document.createElement("style");
       style.textContent = `
         .gallery-root { font-family: system-ui, sans-serif; }
+        .gallery-body.scroll { max-height: 600px; overflow-y: auto; }
         .gallery-grid {
           display: grid;
           grid-template-columns: repeat(auto-fill, minmax(120px, 1fr));
@@ -271,6 +642,8 @@ def _(pl):
             padding: 4px;
           }
         }
+        .gallery-grid:empty { min-height: 240px; }
+        .gallery-sentinel { height: 1px; }
         .gallery-card {
           position: relative; cursor: pointer; border-radius: 6px;
           overflow: hidden; background: #f0f0f0;
@@ -278,6 +651,8 @@ def _(pl):
         }
         .gallery-card.selected { border-color: #3b82f6; }
         .gallery-card img { width: 100%; display: block; }
+        .gallery-sprite { width: 100%; background-repeat: no-repeat; }
+        .gallery-card [hidden] { display: none; }
         .gallery-overlay {
           position: absolute; bottom: 0; left: 0; right: 0;
           background: linear-gradient(transparent, rgba(0,0,0,.75));
@@ -294,6 +669,7 @@ def _(pl):
           background: white; color: #333; cursor: pointer; font-size: 13px;
         }
         .gallery-nav button:disabled { opacity: 0.4; cursor: default; }
+        .gallery-nav button[hidden] { display: none; }
         .gallery-nav span { font-size: 13px; color: #555; min-width: 120px; text-align: center; }
         dialog.gallery-popup {
           border: 1px solid #ccc; border-radius: 12px; padding: 0;
@@ -312,100 +688,816 @@ def _(pl):
       const pageInfo = document.createElement("span");
       const nextBtn = document.createElement("button");
       nextBtn.textContent = "Next \u2192";
-      nav.append(prevBtn, pageInfo, nextBtn);
-      const grid = document.createElement("div");
-      grid.className = "gallery-grid";
+      const similarBtn = document.createElement("button");
+      similarBtn.textContent = "More like these";
+      nav.append(prevBtn, pageInfo, nextBtn, similarBtn);
+      const body = document.createElement("div");
+      body.className = "gallery-body";
+      const sentinel = document.createElement("div");
+      sentinel.className = "gallery-sentinel";
       const popup = document.createElement("dialog");
       popup.className = "gallery-popup";
       popup.addEventListener("click", (e) => { if (e.target === popup) popup.close(); }, { signal });
-      root.append(nav, grid, popup);
+      root.append(nav, body, popup);
       el.appendChild(root);
-      function val(name, i) { return table.getChild(name).at(i); }
-      function totalPages() {
-        if (!table) return 1;
-        return Math.max(1, Math.ceil(table.numRows / model.get("page_size")));
-      }
-      function buildGrid() {
-        grid.innerHTML = "";
-        if (!table) { pageInfo.textContent = "No data"; return; }
-        const ps = model.get("page_size");
-        const selected = new Set(model.get("selected"));
-        const start = currentPage * ps;
-        const end = Math.min(start + ps, table.numRows);
+      function updateNav() {
+        prevBtn.hidden = nextBtn.hidden = scrolling();
+        similarBtn.hidden = !model.get("_searchable") || !numRows();
         prevBtn.disabled = currentPage === 0;
         nextBtn.disabled = currentPage >= totalPages() - 1;
-        pageInfo.textContent = `Page ${currentPage + 1} of ${totalPages()} (${table.numRows.toLocaleString()} total)`;
-        const ROW_H = 8;
-        const GAP = 6;
-        for (let globalIdx = start; globalIdx < end; globalIdx++) {
-          const w = val("width", globalIdx) || 1;
-          const h = val("height", globalIdx) || 1;
-          const ratio = h / w;
-          const card = document.createElement("div");
-          card.className = "gallery-card" + (selected.has(globalIdx) ? " selected" : "");
-          const estHeight = 120 * ratio;
-          const span = Math.max(2, Math.ceil((estHeight + GAP) / (ROW_H + GAP)));
+        if (!numRows()) pageInfo.textContent = "No data";
+        else if (scrolling()) pageInfo.textContent = `${numRows().toLocaleString()} total`;
+        else if (!pages.has(currentPage)) pageInfo.textContent = "Loading\u2026";
+        else pageInfo.textContent = `Page ${currentPage + 1} of ${totalPages()} (${numRows().toLocaleString()} total)`;
+      }
+      // Cards are pooled and reused across pages; blocks hold one page each.
+      function acquireCard() {
+        const recycled = pool.pop();
+        if (recycled) return recycled;
+        const card = document.createElement("div");
+        card.className = "gallery-card";
+        const img = document.createElement("img");
+        img.loading = "lazy";
+        const sprite = document.createElement("div");
+        sprite.className = "gallery-sprite";
+        const overlay = document.createElement("div");
+        overlay.className = "gallery-overlay";
+        card.append(img, sprite, overlay);
+        return card;
+      }
+      // Draw the artwork from its atlas using percentage background offsets,
+      // so the sprite scales with the card width.
+      function drawSprite(sprite, table, i) {
+        const size = table.getChild("atlas_size").at(i);
+        const [x, y, w, h] = ["sprite_x", "sprite_y", "sprite_w", "sprite_h"]
+          .map((name) => table.getChild(name).at(i));
+        sprite.style.aspectRatio = `${w} / ${h}`;
+        sprite.style.backgroundImage = `url("${table.getChild("atlas").at(i)}")`;
+        sprite.style.backgroundSize = `${size / w * 100}% ${size / h * 100}%`;
+        sprite.style.backgroundPosition = `${x / (size - w) * 100}% ${y / (size - h) * 100}%`;
+      }
+      function releaseBlock(block) {
+        if (!block.dataset.filled) return;
+        block.style.height = `${block.offsetHeight}px`;
+        for (const card of [...block.children]) { card.remove(); pool.push(card); }
+        delete block.dataset.filled;
+      }
+      function fillBlock(block) {
+        const page = Number(block.dataset.page);
+        requestPages(page);
+        const table = pages.get(page);
+        if (!table || block.dataset.filled) return;
+        for (let i = 0; i < table.numRows; i++) {
+          const id = Number(table.getChild("objectid").at(i));
+          const w = table.getChild("width").at(i) || 1;
+          const h = table.getChild("height").at(i) || 1;
+          const title = table.getChild("title").at(i) ?? "";
+          const src = table.getChild("thumbnail").at(i);
+          const atlas = table.getChild("atlas")?.at(i);
+          const card = acquireCard();
+          const [img, sprite, overlay] = card.children;
+          card.dataset.page = page;
+          card.dataset.index = i;
+          card.dataset.id = id;
+          card.classList.toggle("selected", selected.has(id));
+          const span = Math.max(2, Math.ceil((120 * h / w + GAP) / (ROW_H + GAP)));
           card.style.gridRowEnd = `span ${span}`;
-          const img = document.createElement("img");
-          img.src = val("thumbnail", globalIdx);
-          img.alt = val("title", globalIdx) ?? "";
-          img.loading = "lazy";
-          card.appendChild(img);
-          const overlay = document.createElement("div");
-          overlay.className = "gallery-overlay";
-          overlay.textContent = val("title", globalIdx) ?? "";
-          card.appendChild(overlay);
-          card.addEventListener("click", (e) => {
-            if (e.metaKey || e.ctrlKey) {
-              const iiif = val("iiif_url", globalIdx);
-              window.open(iiif + "/full/full/0/default.jpg", "_blank");
-              return;
-            }
-            const sel = new Set(model.get("selected"));
-            if (e.shiftKey) {
-              sel.has(globalIdx) ? sel.delete(globalIdx) : sel.add(globalIdx);
-            } else {
-              if (sel.size === 1 && sel.has(globalIdx)) sel.clear();
-              else { sel.clear(); sel.add(globalIdx); }
+          img.hidden = atlas != null;
+          sprite.hidden = atlas == null;
+          if (atlas != null) drawSprite(sprite, table, i);
+          else if (img.getAttribute("src") !== src) img.src = src;
+          img.alt = title;
+          overlay.textContent = title;
+          block.appendChild(card);
+        }
+        block.style.height = "";
+        block.dataset.filled = "1";
+      }
+      function makeBlock(page) {
+        const block = document.createElement("div");
+        block.className = "gallery-grid";
+        block.dataset.page = page;
+        blocks.set(page, block);
+        return block;
+      }
+      // In scroll mode, blocks near the viewport are filled and distant ones
+      // release their cards, keeping their height as a placeholder.
+      const observer = new IntersectionObserver((entries) => {
+        for (const entry of entries) {
+          if (entry.target === sentinel) {
+            if (entry.isIntersecting && blocks.size < totalPages()) {
+              const block = makeBlock(blocks.size);
+              body.insertBefore(block, sentinel);
+              observer.observe(block);
             }
-            model.set("selected", [...sel].sort((a, b) => a - b));
-            model.save_changes();
-          }, { signal });
-          card.addEventListener("contextmenu", (e) => {
-            e.preventDefault();
-            const iiif = val("iiif_url", globalIdx);
-            popup.innerHTML = `
-              <img src="${iiif}/full/!800,800/0/default.jpg"
-                   style="width:100%;display:block;background:#000;" />
-              <div style="padding:16px;">
-                <h3 style="margin:0 0 4px;">${val("title", globalIdx) ?? ""}</h3>
-                <p style="margin:0 0 2px;color:#555;">${val("artist", globalIdx) ?? "Unknown artist"}</p>
-                <p style="margin:0 0 2px;color:#777;font-size:13px;">${val("date", globalIdx) ?? ""}</p>
-                <p style="margin:0 0 2px;color:#777;font-size:13px;">${val("medium", globalIdx) ?? ""}</p>
-                <p style="margin:0;color:#777;font-size:13px;">${val("type", globalIdx) ?? ""}</p>
-              </div>
-            `;
-            popup.showModal();
-          }, { signal });
-          grid.appendChild(card);
+            continue;
+          }
+          const page = Number(entry.target.dataset.page);
+          if (entry.isIntersecting) { visible.add(page); fillBlock(entry.target); }
+          else { visible.delete(page); releaseBlock(entry.target); }
+        }
+      }, { root: body, rootMargin: "100% 0px" });
+      function layout() {
+        observer.disconnect();
+        for (const block of blocks.values()) { releaseBlock(block); block.remove(); }
+        blocks.clear();
+        visible.clear();
+        sentinel.remove();
+        body.classList.toggle("scroll", scrolling());
+        if (numRows() && scrolling()) {
+          body.append(sentinel);
+          observer.observe(sentinel);
+        } else if (numRows()) {
+          const block = makeBlock(currentPage);
+          body.append(block);
+          visible.add(currentPage);
+          fillBlock(block);
+        }
+        body.scrollTop = 0;
+        updateNav();
+      }
+      function syncSelection() {
+        selected = new Set(decodeIds(model.get("_selected")));
+        for (const card of body.querySelectorAll(".gallery-card")) {
+          card.classList.toggle("selected", selected.has(Number(card.dataset.id)));
         }
       }
+      function cardData(e) {
+        const card = e.target.closest(".gallery-card");
+        if (!card) return null;
+        const table = pages.get(Number(card.dataset.page));
+        const i = Number(card.dataset.index);
+        return {
+          id: Number(card.dataset.id),
+          val: (name) => table.getChild(name).at(i),
+        };
+      }
+      body.addEventListener("click", (e) => {
+        const data = cardData(e);
+        if (!data) return;
+        if (e.metaKey || e.ctrlKey) {
+          window.open(data.val("iiif_url") + "/full/full/0/default.jpg", "_blank");
+          return;
+        }
+        const sel = new Set(selected);
+        if (e.shiftKey) {
+          sel.has(data.id) ? sel.delete(data.id) : sel.add(data.id);
+        } else {
+          if (sel.size === 1 && sel.has(data.id)) sel.clear();
+          else { sel.clear(); sel.add(data.id); }
+        }
+        const ids = Int32Array.from(sel).sort();
+        model.send({ type: "select" }, undefined, [ids.buffer]);
+      }, { signal });
+      body.addEventListener("contextmenu", (e) => {
+        const data = cardData(e);
+        if (!data) return;
+        e.preventDefault();
+        const val = data.val;
+        popup.innerHTML = `
+          <img src="${val("iiif_url")}/full/!800,800/0/default.jpg"
+               style="width:100%;display:block;background:#000;" />
+          <div style="padding:16px;">
+            <h3 style="margin:0 0 4px;">${val("title") ?? ""}</h3>
+            <p style="margin:0 0 2px;color:#555;">${val("artist") ?? "Unknown artist"}</p>
+            <p style="margin:0 0 2px;color:#777;font-size:13px;">${val("date") ?? ""}</p>
+            <p style="margin:0 0 2px;color:#777;font-size:13px;">${val("medium") ?? ""}</p>
+            <p style="margin:0;color:#777;font-size:13px;">${val("type") ?? ""}</p>
+          </div>
+        `;
+        if (model.get("_searchable")) {
+          const ids = selected.has(data.id) ? [...selected] : [data.id];
+          const similar = document.createElement("button");
+          similar.textContent = ids.length > 1
+            ? `Similar to ${ids.length} artworks`
+            : "Similar artworks";
+          similar.style.cssText = "margin:0 16px 16px;";
+          similar.addEventListener("click", () => {
+            model.send({ type: "similar", ids });
+            popup.close();
+          });
+          popup.querySelector("div").append(similar);
+        }
+        popup.showModal();
+      }, { signal });
       prevBtn.addEventListener("click", () => {
-        if (currentPage > 0) { currentPage--; buildGrid(); grid.scrollTop = 0; }
+        if (currentPage > 0) { currentPage--; layout(); }
       }, { signal });
       nextBtn.addEventListener("click", () => {
-        if (currentPage < totalPages() - 1) { currentPage++; buildGrid(); grid.scrollTop = 0; }
+        if (currentPage < totalPages() - 1) { currentPage++; layout(); }
+      }, { signal });
+      similarBtn.addEventListener("click", () => {
+        model.send({ type: "similar", ids: null });
+      }, { signal });
+      model.on("msg:custom", async (msg, buffers) => {
+        if (msg.type !== "page") return;
+        await codecReady;
+        if (msg.view !== view) return;
+        const buf = buffers[0];
+        pending.delete(msg.page);
+        pages.set(msg.page, tableFromIPC(new Uint8Array(buf.buffer, buf.byteOffset, buf.byteLength)));
+        const block = blocks.get(msg.page);
+        if (block && visible.has(msg.page)) fillBlock(block);
+        if (scrolling()) {
+          // re-check whether the sentinel is still in view
+          observer.unobserve(sentinel);
+          observer.observe(sentinel);
+        }
+        updateNav();
+      });
+      model.on("change:_view", () => { resetPages(); layout(); });
+      model.on("change:page_size", () => { resetPages(); layout(); });
+      model.on("change:mode", () => { currentPage = 0; layout(); });
+      model.on("change:compression", () => {
+        codecReady = loadCodec(model.get("compression"));
+        resetPages();
+        layout();
+      });
+      model.on("change:_selected", syncSelection);
+      layout();
+      return () => { observer.disconnect(); controller.abort(); };
+    }
+    export default { render };
+    """
+
+    return GalleryWidget, anywidget, np, traitlets
+
+
+@app.cell(hide_code=True)
+def layout_index(np):
+    from scipy.spatial import cKDTree
+
+
+    class LayoutIndex:
+        """KD-tree and x-sorted order over 2D layout coordinates.
+
+        Built once per layout. Region queries return the matching frame rows
+        as a sorted uint32 array; ``nearest`` returns rows by distance.
+        Rectangles binary-search the x-sorted order for their x range and
+        trim that slice by y, so they never build per-query Python lists.
+        """
+
+        def __init__(self, data: pl.DataFrame, x: str = "x", y: str = "y"):
+            self.points = np.column_stack(
+                [data.get_column(x).to_numpy(), data.get_column(y).to_numpy()]
+            ).astype(np.float64)
+            self.tree = cKDTree(self.points)
+            self._by_x = np.argsort(self.points[:, 0], kind="stable").astype(
+                np.uint32
+            )
+            self._x_sorted = self.points[self._by_x, 0]
+            self._y_by_x = self.points[self._by_x, 1]
+
+        @staticmethod
+        def _rows(hits) -> np.ndarray:
+            return np.unique(np.asarray(hits, dtype=np.uint32))
+
+        def radius(self, x: float, y: float, r: float) -> np.ndarray:
+            """Rows within distance ``r`` of ``(x, y)``."""
+            return self._rows(self.tree.query_ball_point((x, y), r))
+
+        def rectangle(
+            self, x0: float, y0: float, x1: float, y1: float
+        ) -> np.ndarray:
+            """Rows inside the axis-aligned rectangle spanned by two corners.
+
+            Both spans are closed intervals, so a zero-width or zero-height
+            rectangle selects the points on its edge.
+            """
+            (x0, x1), (y0, y1) = sorted((x0, x1)), sorted((y0, y1))
+            start = np.searchsorted(self._x_sorted, x0, side="left")
+            stop = np.searchsorted(self._x_sorted, x1, side="right")
+            py = self._y_by_x[start:stop]
+            return np.sort(self._by_x[start:stop][(py >= y0) & (py <= y1)])
+
+        def polygon(self, vertices) -> np.ndarray:
+            """Rows inside a lasso polygon given as ``[(x, y), ...]``."""
+            vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+            if len(vertices) < 3:
+                return self._rows([])
+            (x0, y0), (x1, y1) = vertices.min(axis=0), vertices.max(axis=0)
+            rows = self.rectangle(x0, y0, x1, y1)
+            px, py = self.points[rows].T
+            hit = np.zeros(len(rows), dtype=bool)
+            # even-odd rule, one polygon edge at a time
+            for (xi, yi), (xj, yj) in zip(vertices, np.roll(vertices, 1, 0)):
+                if yi == yj:
+                    continue
+                crosses = (yi > py) != (yj > py)
+                hit ^= crosses & (px < (xj - xi) * (py - yi) / (yj - yi) + xi)
+            return rows[hit]
+
+        def nearest(
+            self, x: float, y: float, k: int = 10
+        ) -> tuple[np.ndarray, np.ndarray]:
+            """Rows and distances of the ``k`` points closest to ``(x, y)``."""
+            k = min(k, len(self.points))
+            distances, rows = self.tree.query((x, y), k=k)
+            rows = np.atleast_1d(rows).astype(np.uint32)
+            return rows, np.atleast_1d(distances)
+
+    return (LayoutIndex,)
+
+
+@app.cell(hide_code=True)
+def _(anywidget, np, traitlets):
+    class ScatterWidget(anywidget.AnyWidget):
+        """WebGL scatter plot for large point counts.
+
+        x, y and a color category are packed into Float32/UInt8 Arrow
+        columns and streamed in chunks of one fixed random permutation, so
+        every loaded prefix is a uniform sample. The browser draws at most
+        ``lod_points`` points (more as you zoom in) and only requests the
+        chunks it needs. Drag to pan, scroll to zoom, shift-drag to lasso.
+        ``selection`` holds the selected row indices as a uint32 array;
+        ``select`` sets it from Python, and ``highlight`` emphasizes rows
+        without changing the selection. Given a ``LayoutIndex``, lassos are
+        resolved in Python against every point, loaded or not; otherwise
+        only against the points the browser has loaded.
+        """
+
+        num_points = traitlets.Int(0).tag(sync=True)
+        chunk_size = traitlets.Int(65_536).tag(sync=True)
+        lod_points = traitlets.Int(250_000).tag(sync=True)
+        categories = traitlets.List([]).tag(sync=True)
+        bounds = traitlets.List([0.0, 1.0, 0.0, 1.0]).tag(sync=True)
+        height = traitlets.Int(500).tag(sync=True)
+        point_size = traitlets.Float(3.0).tag(sync=True)
+        selection = traitlets.Any(np.zeros(0, np.uint32))
+        _server_lasso = traitlets.Bool(False).tag(sync=True)
+
+        def __init__(
+            self,
+            data: pl.DataFrame,
+            x: str = "x",
+            y: str = "y",
+            *,
+            color_by: str | None = None,
+            label: str | None = None,
+            preview: str | None = None,
+            index=None,
+            seed: int = 42,
+            **kwargs,
+        ):
+            super().__init__(**kwargs)
+            self._frame = data
+            self._index = index
+            self._server_lasso = index is not None
+            self._label = label
+            self._preview = preview
+            self._order = (
+                np.random.default_rng(seed)
+                .permutation(data.height)
+                .astype(np.uint32)
+            )
+            self._rank = np.empty_like(self._order)
+            self._rank[self._order] = np.arange(data.height, dtype=np.uint32)
+
+            codes = pl.repeat(255, data.height, dtype=pl.UInt8, eager=True)
+            if color_by is not None:
+                values = data.get_column(color_by).cast(pl.String)
+                self.categories = (
+                    values.drop_nulls()
+                    .value_counts(sort=True)
+                    .get_column(color_by)
+                    .head(255)
+                    .to_list()
+                )
+                codes = values.replace_strict(
+                    self.categories,
+                    list(range(len(self.categories))),
+                    default=255,
+                    return_dtype=pl.UInt8,
+                ).fill_null(255)
+            points = pl.DataFrame(
+                {
+                    "x": data.get_column(x).cast(pl.Float32),
+                    "y": data.get_column(y).cast(pl.Float32),
+                    "category": codes,
+                }
+            )
+            # stored in streaming order, so each chunk is a zero-copy slice
+            self._points = points.select(pl.all().gather(self._order))
+            if data.height:
+                self.bounds = [
+                    float(points["x"].min()),
+                    float(points["x"].max()),
+                    float(points["y"].min()),
+                    float(points["y"].max()),
+                ]
+            self.num_points = data.height
+            self.on_msg(self._handle_message)
+
+        def select(self, indices) -> None:
+            """Set ``selection`` to the rows at ``indices`` and highlight them."""
+            rows = np.unique(np.asarray(indices, dtype=np.uint32))
+            self.selection = rows
+            self.send(
+                {"type": "selection"}, buffers=[self._rank[rows].tobytes()]
+            )
+
+        def highlight(self, add=(), remove=()) -> None:
+            """Emphasize the rows ``add`` and stop emphasizing ``remove``."""
+            self.send(
+                {"type": "highlight"},
+                buffers=[
+                    self._rank[np.asarray(add, dtype=np.uint32)].tobytes(),
+                    self._rank[np.asarray(remove, dtype=np.uint32)].tobytes(),
+                ],
+            )
+
+        def _tooltip(self, index: int) -> dict:
+            row = self._frame.row(int(self._order[index]), named=True)
+            return {
+                "type": "tooltip",
+                "index": index,
+                "label": row[self._label] if self._label else None,
+                "preview": row[self._preview] if self._preview else None,
+            }
+
+        def _handle_message(self, _, content, buffers) -> None:
+            kind = content.get("type")
+            if kind == "chunks":
+                for chunk in content["chunks"]:
+                    start = chunk * self.chunk_size
+                    self.send(
+                        {"type": "chunk", "chunk": chunk},
+                        buffers=[
+                            encode_ipc(
+                                self._points.slice(start, self.chunk_size)
+                            )
+                        ],
+                    )
+            elif kind == "select":
+                positions = np.frombuffer(
+                    buffers[0] if buffers else b"", dtype=np.uint32
+                )
+                self.selection = np.sort(self._order[positions])
+            elif kind == "lasso" and self._index is not None:
+                self.select(self._index.polygon(content["polygon"]))
+            elif kind == "hover":
+                self.send(self._tooltip(content["index"]))
+
+        _esm = """
+    import { tableFromIPC } from "https://esm.sh/@uwdata/flechette@2";
+    const PALETTE = [
+      "#4e79a7", "#f28e2b", "#e15759", "#76b7b2", "#59a14f",
+      "#edc948", "#b07aa1", "#ff9da7", "#9c755f", "#bab0ac",
+      "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+      "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf",
+    ];
+    const rgb = (hex) => [1, 3, 5].map((i) => parseInt(hex.slice(i, i + 2), 16) / 255);
+    const VERT = `
+      attribute vec2 a_pos;
+      attribute float a_category;
+      attribute float a_flags;
+      uniform vec2 u_scale;
+      uniform vec2 u_offset;
+      uniform float u_size;
+      uniform float u_any_selected;
+      uniform vec3 u_palette[20];
+      varying vec4 v_color;
+      void main() {
+        gl_Position = vec4(a_pos * u_scale + u_offset, 0.0, 1.0);
+        vec3 color = a_category > 254.5
+          ? vec3(0.45, 0.5, 0.6)
+          : u_palette[int(mod(a_category, 20.0))];
+        // flags: 1 = selected, 2 = highlighted
+        bool selected = mod(a_flags, 2.0) > 0.5;
+        bool highlighted = a_flags > 1.5;
+        bool dim = u_any_selected > 0.5 && !selected && !highlighted;
+        v_color = vec4(color, dim ? 0.12 : 0.85);
+        gl_PointSize = highlighted ? u_size * 2.5 : selected ? u_size * 1.5 : u_size;
+      }
+    `;
+    const FRAG = `
+      precision mediump float;
+      varying vec4 v_color;
+      void main() {
+        vec2 d = gl_PointCoord - 0.5;
+        if (dot(d, d) > 0.25) discard;
+        gl_FragColor = v_color;
+      }
+    `;
+    function compile(gl) {
+      const program = gl.createProgram();
+      for (const [type, source] of [[gl.VERTEX_SHADER, VERT], [gl.FRAGMENT_SHADER, FRAG]]) {
+        const shader = gl.createShader(type);
+        gl.shaderSource(shader, source);
+        gl.compileShader(shader);
+        if (!gl.getShaderParameter(shader, gl.COMPILE_STATUS)) {
+          throw new Error(gl.getShaderInfoLog(shader));
+        }
+        gl.attachShader(program, shader);
+      }
+      gl.linkProgram(program);
+      if (!gl.getProgramParameter(program, gl.LINK_STATUS)) {
+        throw new Error(gl.getProgramInfoLog(program));
+      }
+      return program;
+    }
+    // Even-odd point-in-polygon test against a flat [x0, y0, x1, y1, ...] ring.
+    function inside(px, py, poly) {
+      let hit = false;
+      for (let i = 0, j = poly.length - 2; i < poly.length; j = i, i += 2) {
+        const xi = poly[i], yi = poly[i + 1], xj = poly[j], yj = poly[j + 1];
+        if ((yi > py) !== (yj > py) && px < (xj - xi) * (py - yi) / (yj - yi) + xi) hit = !hit;
+      }
+      return hit;
+    }
+    function render({ model, el }) {
+      const controller = new AbortController();
+      const { signal } = controller;
+      const n = model.get("num_points");
+      const chunkSize = model.get("chunk_size");
+      const xs = new Float32Array(n);
+      const ys = new Float32Array(n);
+      const flags = new Uint8Array(n);
+      const chunks = new Set();
+      const pending = new Set();
+      let loaded = 0;
+      let anySelected = false;
+      const [x0, x1, y0, y1] = model.get("bounds");
+      const view = { cx: (x0 + x1) / 2, cy: (y0 + y1) / 2, zoom: 1 };
+
+      const style = document.createElement("style");
+      style.textContent = `
+        .scatter-root { position: relative; font-family: system-ui, sans-serif; }
+        .scatter-root canvas { width: 100%; display: block; cursor: grab; touch-action: none; }
+        .scatter-lasso { position: absolute; inset: 0; pointer-events: none; }
+        .scatter-legend {
+          position: absolute; top: 8px; right: 8px; padding: 6px 8px;
+          background: rgba(255,255,255,.85); border-radius: 6px; font-size: 11px;
+          max-height: 60%; overflow-y: auto;
+        }
+        .scatter-legend div { display: flex; align-items: center; gap: 6px; }
+        .scatter-legend i { width: 8px; height: 8px; border-radius: 50%; }
+        .scatter-status { position: absolute; bottom: 6px; left: 8px; font-size: 11px; color: #777; }
+        .scatter-tooltip {
+          position: absolute; pointer-events: none; max-width: 200px; padding: 6px;
+          background: white; border: 1px solid #ccc; border-radius: 6px;
+          box-shadow: 0 2px 8px rgba(0,0,0,.2); font-size: 12px;
+        }
+        .scatter-tooltip img { display: block; max-width: 100%; max-height: 160px; margin-bottom: 4px; }
+      `;
+      el.appendChild(style);
+      const root = document.createElement("div");
+      root.className = "scatter-root";
+      const canvas = document.createElement("canvas");
+      canvas.style.height = `${model.get("height")}px`;
+      const lasso = document.createElementNS("http://www.w3.org/2000/svg", "svg");
+      lasso.classList.add("scatter-lasso");
+      const lassoPath = document.createElementNS("http://www.w3.org/2000/svg", "polygon");
+      lassoPath.setAttribute("fill", "rgba(59,130,246,.1)");
+      lassoPath.setAttribute("stroke", "#3b82f6");
+      lasso.appendChild(lassoPath);
+      const legend = document.createElement("div");
+      legend.className = "scatter-legend";
+      model.get("categories").forEach((name, i) => {
+        const item = document.createElement("div");
+        const swatch = document.createElement("i");
+        swatch.style.background = PALETTE[i % PALETTE.length];
+        item.append(swatch, name);
+        legend.appendChild(item);
+      });
+      legend.hidden = !model.get("categories").length;
+      const status = document.createElement("div");
+      status.className = "scatter-status";
+      const tooltip = document.createElement("div");
+      tooltip.className = "scatter-tooltip";
+      tooltip.hidden = true;
+      root.append(canvas, lasso, legend, status, tooltip);
+      el.appendChild(root);
+
+      const gl = canvas.getContext("webgl", { antialias: false, premultipliedAlpha: false });
+      const program = compile(gl);
+      gl.useProgram(program);
+      gl.enable(gl.BLEND);
+      gl.blendFunc(gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA);
+      const loc = (name) => gl.getUniformLocation(program, name);
+      gl.uniform3fv(loc("u_palette"), PALETTE.flatMap(rgb));
+      // Buffers are sized for every point up front; chunks fill them in place.
+      function attribute(name, size, type, bytes) {
+        const buffer = gl.createBuffer();
+        const index = gl.getAttribLocation(program, name);
+        gl.bindBuffer(gl.ARRAY_BUFFER, buffer);
+        gl.bufferData(gl.ARRAY_BUFFER, Math.max(bytes, 4), gl.DYNAMIC_DRAW);
+        gl.enableVertexAttribArray(index);
+        gl.vertexAttribPointer(index, size, type, false, 0, 0);
+        return buffer;
+      }
+      const posBuffer = attribute("a_pos", 2, gl.FLOAT, n * 8);
+      const catBuffer = attribute("a_category", 1, gl.UNSIGNED_BYTE, n);
+      const flagBuffer = attribute("a_flags", 1, gl.UNSIGNED_BYTE, n);
+
+      function pixelsPerUnit() {
+        const w = canvas.clientWidth, h = canvas.clientHeight;
+        return Math.min(w / Math.max(x1 - x0, 1e-9), h / Math.max(y1 - y0, 1e-9)) * 0.95 * view.zoom;
+      }
+      function toData(px, py) {
+        const ppu = pixelsPerUnit();
+        return [
+          (px - canvas.clientWidth / 2) / ppu + view.cx,
+          -(py - canvas.clientHeight / 2) / ppu + view.cy,
+        ];
+      }
+      // Level of detail: the number of points worth drawing at this zoom.
+      function budget() {
+        return Math.min(n, Math.ceil(model.get("lod_points") * view.zoom * view.zoom));
+      }
+      function requestChunks() {
+        const wanted = [];
+        for (let c = 0; c < Math.ceil(budget() / chunkSize); c++) {
+          if (!chunks.has(c) && !pending.has(c)) { pending.add(c); wanted.push(c); }
+        }
+        if (wanted.length) model.send({ type: "chunks", chunks: wanted });
+      }
+      let frame = 0;
+      function draw() {
+        if (frame) return;
+        frame = requestAnimationFrame(() => {
+          frame = 0;
+          const dpr = window.devicePixelRatio || 1;
+          const w = canvas.clientWidth, h = canvas.clientHeight;
+          if (canvas.width !== w * dpr || canvas.height !== h * dpr) {
+            canvas.width = w * dpr;
+            canvas.height = h * dpr;
+          }
+          gl.viewport(0, 0, canvas.width, canvas.height);
+          gl.clearColor(1, 1, 1, 1);
+          gl.clear(gl.COLOR_BUFFER_BIT);
+          const ppu = pixelsPerUnit();
+          const sx = 2 * ppu / w, sy = 2 * ppu / h;
+          gl.uniform2f(loc("u_scale"), sx, sy);
+          gl.uniform2f(loc("u_offset"), -view.cx * sx, -view.cy * sy);
+          gl.uniform1f(loc("u_size"), model.get("point_size") * dpr);
+          gl.uniform1f(loc("u_any_selected"), anySelected ? 1 : 0);
+          const count = Math.min(loaded, budget());
+          gl.drawArrays(gl.POINTS, 0, count);
+          status.textContent = `${count.toLocaleString()} of ${n.toLocaleString()} points`;
+        });
+      }
+      function uploadFlags() {
+        gl.bindBuffer(gl.ARRAY_BUFFER, flagBuffer);
+        gl.bufferSubData(gl.ARRAY_BUFFER, 0, flags);
+        draw();
+      }
+      function setSelection(positions) {
+        for (let i = 0; i < n; i++) flags[i] &= 2;
+        for (const i of positions) flags[i] |= 1;
+        anySelected = positions.length > 0;
+        uploadFlags();
+      }
+      function setHighlight(added, removed) {
+        for (const i of removed) flags[i] &= 1;
+        for (const i of added) flags[i] |= 2;
+        uploadFlags();
+      }
+      function select(polygon) {
+        if (model.get("_server_lasso")) {
+          // Python answers with a "selection" message covering every point
+          model.send({ type: "lasso", polygon });
+          return;
+        }
+        let [minX, minY, maxX, maxY] = [Infinity, Infinity, -Infinity, -Infinity];
+        for (let i = 0; i < polygon.length; i += 2) {
+          minX = Math.min(minX, polygon[i]); maxX = Math.max(maxX, polygon[i]);
+          minY = Math.min(minY, polygon[i + 1]); maxY = Math.max(maxY, polygon[i + 1]);
+        }
+        const hits = [];
+        for (let i = 0; i < loaded; i++) {
+          const x = xs[i], y = ys[i];
+          if (x >= minX && x <= maxX && y >= minY && y <= maxY && inside(x, y, polygon)) hits.push(i);
+        }
+        const positions = Uint32Array.from(hits);
+        setSelection(positions);
+        model.send({ type: "select" }, undefined, [positions.buffer]);
+      }
+
+      // Pan on drag, lasso on shift-drag, clear the selection on a plain click.
+      let drag = null;
+      canvas.addEventListener("pointerdown", (e) => {
+        canvas.setPointerCapture(e.pointerId);
+        drag = { x: e.offsetX, y: e.offsetY, moved: false, lasso: e.shiftKey ? [] : null };
+        tooltip.hidden = true;
+      }, { signal });
+      canvas.addEventListener("pointermove", (e) => {
+        if (!drag) { hover(e.offsetX, e.offsetY); return; }
+        drag.moved ||= Math.abs(e.offsetX - drag.x) + Math.abs(e.offsetY - drag.y) > 3;
+        if (drag.lasso) {
+          drag.lasso.push(e.offsetX, e.offsetY);
+          lassoPath.setAttribute("points", drag.lasso.join(" "));
+          return;
+        }
+        const ppu = pixelsPerUnit();
+        view.cx -= e.movementX / ppu;
+        view.cy += e.movementY / ppu;
+        draw();
       }, { signal });
-      model.on("change:_data", () => { parseTable(); currentPage = 0; buildGrid(); });
-      model.on("change:selected", buildGrid);
-      parseTable();
-      buildGrid();
-      return () => controller.abort();
+      canvas.addEventListener("pointerup", () => {
+        if (drag?.lasso && drag.lasso.length >= 6) {
+          const polygon = [];
+          for (let i = 0; i < drag.lasso.length; i += 2) {
+            polygon.push(...toData(drag.lasso[i], drag.lasso[i + 1]));
+          }
+          select(polygon);
+        } else if (drag && !drag.moved && anySelected) {
+          setSelection([]);
+          model.send({ type: "select" }, undefined, [new Uint32Array(0).buffer]);
+        }
+        lassoPath.setAttribute("points", "");
+        drag = null;
+      }, { signal });
+      canvas.addEventListener("wheel", (e) => {
+        e.preventDefault();
+        const [bx, by] = toData(e.offsetX, e.offsetY);
+        view.zoom = Math.min(Math.max(view.zoom * Math.exp(-e.deltaY * 0.002), 0.5), 1000);
+        const [ax, ay] = toData(e.offsetX, e.offsetY);
+        view.cx += bx - ax;
+        view.cy += by - ay;
+        requestChunks();
+        draw();
+      }, { signal, passive: false });
+      canvas.addEventListener("pointerleave", () => { tooltip.hidden = true; }, { signal });
+
+      // Hover picks the nearest drawn point within a few pixels.
+      let hovered = -1;
+      function hover(px, py) {
+        const [x, y] = toData(px, py);
+        const radius = 6 / pixelsPerUnit();
+        let best = -1, bestDist = radius * radius;
+        const count = Math.min(loaded, budget());
+        for (let i = 0; i < count; i++) {
+          const dx = xs[i] - x, dy = ys[i] - y;
+          const dist = dx * dx + dy * dy;
+          if (dist < bestDist) { best = i; bestDist = dist; }
+        }
+        tooltip.style.left = `${px + 12}px`;
+        tooltip.style.top = `${py + 12}px`;
+        if (best < 0) tooltip.hidden = true;
+        else if (best !== hovered) model.send({ type: "hover", index: best });
+        else tooltip.hidden = false;
+        hovered = best;
+      }
+
+      model.on("msg:custom", (msg, buffers) => {
+        if (msg.type === "tooltip") {
+          if (msg.index !== hovered || (msg.label == null && msg.preview == null)) return;
+          tooltip.replaceChildren();
+          if (msg.preview) {
+            const img = document.createElement("img");
+            img.src = msg.preview;
+            tooltip.appendChild(img);
+          }
+          if (msg.label) tooltip.append(msg.label);
+          tooltip.hidden = false;
+          return;
+        }
+        const [buf] = buffers;
+        const bytes = new Uint8Array(buf.buffer, buf.byteOffset, buf.byteLength);
+        if (msg.type === "highlight") {
+          const [added, removed] = buffers.map((b) => new Uint32Array(
+            b.buffer.slice(b.byteOffset, b.byteOffset + b.byteLength)));
+          setHighlight(added, removed);
+          return;
+        }
+        if (msg.type === "selection") {
+          setSelection(new Uint32Array(bytes.slice().buffer));
+          return;
+        }
+        if (msg.type !== "chunk") return;
+        const table = tableFromIPC(bytes);
+        const start = msg.chunk * chunkSize;
+        const x = table.getChild("x").toArray();
+        const y = table.getChild("y").toArray();
+        xs.set(x, start);
+        ys.set(y, start);
+        const pos = new Float32Array(x.length * 2);
+        for (let i = 0; i < x.length; i++) { pos[2 * i] = x[i]; pos[2 * i + 1] = y[i]; }
+        gl.bindBuffer(gl.ARRAY_BUFFER, posBuffer);
+        gl.bufferSubData(gl.ARRAY_BUFFER, start * 8, pos);
+        gl.bindBuffer(gl.ARRAY_BUFFER, catBuffer);
+        gl.bufferSubData(gl.ARRAY_BUFFER, start, table.getChild("category").toArray());
+        pending.delete(msg.chunk);
+        chunks.add(msg.chunk);
+        // only the contiguous prefix of chunks is drawn
+        while (chunks.has(Math.floor(loaded / chunkSize)) && loaded < n) {
+          loaded = Math.min(n, (Math.floor(loaded / chunkSize) + 1) * chunkSize);
+        }
+        draw();
+      });
+      model.on("change:point_size", draw);
+      model.on("change:lod_points", () => { requestChunks(); draw(); });
+      const resize = new ResizeObserver(draw);
+      resize.observe(canvas);
+      requestChunks();
+      draw();
+      return () => { resize.disconnect(); controller.abort(); };
     }
     export default { render };
     """
 
-    return (GalleryWidget,)
+    return (ScatterWidget,)
 
 
 @app.cell(hide_code=True)
@@ -417,33 +1509,235 @@ def _(mo):
 
 
 @app.cell
-def _(df, mo):
-    import jscatter
-
-    # jupyter-scatter requires pandas
-    pdf = df.to_pandas()
+def _(LayoutIndex, df):
+    layout = LayoutIndex(df)
+    return (layout,)
 
-    scatter = jscatter.Scatter(x="x", y="y", data=pdf)
-    scatter.height(500)
-    scatter.color(by="type")
-    scatter.legend(True)
-    scatter.tooltip(True, preview="thumbnail", preview_type="image")
 
-    get_selection, set_selection = mo.state(scatter.widget.selection)
-    scatter.widget.observe(
-        lambda _: set_selection(scatter.widget.selection), names=["selection"]
+@app.cell
+def _(LinkedSelection, ScatterWidget, df, gallery, layout):
+    scatter = ScatterWidget(
+        df,
+        color_by="type",
+        label="title",
+        preview="thumbnail",
+        index=layout,
+        height=500,
     )
-    scatter.widget
-    return get_selection, pdf
+
+    # lassoing narrows the gallery; selected cards light up in the scatter
+    link = LinkedSelection(scatter, gallery)
+    scatter
+    return (link,)
+
+
+@app.cell(hide_code=True)
+def _(np):
+    class LinkedSelection:
+        """Link a ScatterWidget and a GalleryWidget by object ID.
+
+        A lasso in the scatter narrows the gallery to those artworks, and
+        cards selected in the gallery are highlighted in the scatter. Gallery
+        selection changes are sent as added/removed IDs, so an update costs
+        time proportional to what changed and neither widget is rebuilt.
+        """
+
+        def __init__(self, scatter, gallery, key: str = "objectid"):
+            self.scatter = scatter
+            self.gallery = gallery
+            self._ids = scatter._frame.get_column(key).to_numpy()
+            self._order = np.argsort(self._ids, kind="stable")
+            self._sorted = self._ids[self._order]
+            scatter.observe(self._on_scatter, names=["selection"])
+            gallery.observe(self._on_gallery, names=["selected"])
+            self._on_gallery(
+                {"old": np.zeros(0, np.int32), "new": gallery.selected}
+            )
+
+        def scatter_rows(self, object_ids) -> np.ndarray:
+            """Scatter rows holding ``object_ids``, skipping unknown IDs."""
+            ids = np.asarray(object_ids, dtype=self._sorted.dtype)
+            if not len(self._sorted):
+                return np.zeros(0, np.uint32)
+            pos = np.searchsorted(self._sorted, ids)
+            pos = np.minimum(pos, len(self._sorted) - 1)
+            return self._order[pos[self._sorted[pos] == ids]]
+
+        def _on_scatter(self, change) -> None:
+            ids = self._ids[change["new"]]
+            self.gallery.show(self.gallery.rows_for(ids))
+
+        def _on_gallery(self, change) -> None:
+            old, new = change["old"], change["new"]
+            self.scatter.highlight(
+                add=self.scatter_rows(np.setdiff1d(new, old)),
+                remove=self.scatter_rows(np.setdiff1d(old, new)),
+            )
+
+    return (LinkedSelection,)
+
+
+@app.cell(hide_code=True)
+def _(np, pathlib):
+    class EmbeddingIndex:
+        """Cosine top-k search over memory-mapped, L2-normalized embeddings.
+
+        Reads the directory written by scripts/similarity_index.py. Vectors
+        are sorted by object ID and only paged in as they are scanned. If
+        the directory holds an IVF index, ``nprobe`` limits a centroid
+        search to the vectors in the closest clusters.
+        """
+
+        def __init__(self, directory):
+            directory = pathlib.Path(directory)
+            self.vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+            self.object_ids = np.load(directory / "object_ids.npy")
+            self.centroids = None
+            if (directory / "centroids.npy").exists():
+                self.centroids = np.load(directory / "centroids.npy")
+                self.list_offsets = np.load(directory / "list_offsets.npy")
+                self.list_members = np.load(directory / "list_members.npy")
+
+        def positions(self, object_ids) -> np.ndarray:
+            """Matrix rows of ``object_ids``, skipping unknown IDs."""
+            ids = np.asarray(object_ids, dtype=self.object_ids.dtype)
+            pos = np.searchsorted(self.object_ids, ids)
+            pos = np.minimum(pos, len(self.object_ids) - 1)
+            return pos[self.object_ids[pos] == ids]
+
+        def _candidates(self, query: np.ndarray, nprobe: int | None):
+            if self.centroids is None or nprobe is None:
+                return None
+            nprobe = min(nprobe, len(self.centroids))
+            lists = np.argpartition(-(self.centroids @ query), nprobe - 1)
+            return np.sort(
+                np.concatenate(
+                    [
+                        self.list_members[
+                            self.list_offsets[i] : self.list_offsets[i + 1]
+                        ]
+                        for i in lists[:nprobe]
+                    ]
+                )
+            )
+
+        @staticmethod
+        def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+            """Indices of the ``k`` highest finite scores, best first."""
+            k = min(k, len(scores))
+            if k == 0:
+                return np.zeros(0, np.int64)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return top[np.isfinite(scores[top])]
+
+        def search(
+            self,
+            query: np.ndarray,
+            k: int = 50,
+            *,
+            exclude=(),
+            nprobe: int | None = None,
+        ) -> tuple[np.ndarray, np.ndarray]:
+            """Rows and scores of the ``k`` vectors closest to ``query``."""
+            candidates = self._candidates(query, nprobe)
+            if candidates is None:
+                positions = np.arange(len(self.vectors))
+                scores = self.vectors @ query
+            else:
+                positions = candidates
+                scores = self.vectors[candidates] @ query
+            scores[np.isin(positions, exclude)] = -np.inf
+            top = self._top_k(scores, k)
+            return positions[top], scores[top]
+
+        def search_max(
+            self,
+            queries: np.ndarray,
+            k: int = 50,
+            *,
+            max_bytes: int = 64 << 20,
+        ) -> tuple[np.ndarray, np.ndarray]:
+            """Rows and scores of the ``k`` vectors closest to any of the rows
+            ``queries``, excluding them.
+
+            The collection is scanned in chunks sized so each chunk's score
+            block (rows x queries) stays under ``max_bytes``, keeping a running
+            top ``k``.
+            """
+            block = np.ascontiguousarray(self.vectors[queries].T)
+            step = max(1, max_bytes // (4 * max(len(queries), 1)))
+            best = np.zeros(0, np.int64)
+            best_scores = np.zeros(0, np.float32)
+            for start in range(0, len(self.vectors), step):
+                scores = (self.vectors[start : start + step] @ block).max(
+                    axis=1
+                )
+                inside = queries[(queries >= start) & (queries < start + step)]
+                scores[inside - start] = -np.inf
+                top = self._top_k(scores, k)
+                rows = np.concatenate([best, top + start])
+                merged = np.concatenate([best_scores, scores[top]])
+                keep = self._top_k(merged, k)
+                best, best_scores = rows[keep], merged[keep]
+            return best, best_scores
+
+        def similar(
+            self,
+            object_ids,
+            k: int = 50,
+            *,
+            mode: str = "centroid",
+            nprobe: int | None = None,
+            max_bytes: int = 64 << 20,
+        ) -> pl.DataFrame:
+            """The ``k`` artworks most similar to ``object_ids`` as a set.
+
+            ``mode="centroid"`` ranks by similarity to the normalized mean of
+            the query vectors, ``mode="max"`` by the best similarity to any
+            one of them. The query artworks are never returned.
+            """
+            queries = np.unique(self.positions(object_ids))
+            if len(queries) == 0:
+                positions, scores = np.zeros(0, np.int64), np.zeros(0)
+            elif mode == "centroid":
+                centroid = self.vectors[queries].mean(axis=0)
+                centroid /= max(float(np.linalg.norm(centroid)), 1e-12)
+                positions, scores = self.search(
+                    centroid, k, exclude=queries, nprobe=nprobe
+                )
+            elif mode == "max":
+                positions, scores = self.search_max(
+                    queries, k, max_bytes=max_bytes
+                )
+            else:
+                raise ValueError(f"unknown mode: {mode!r}")
+            return pl.DataFrame(
+                {
+                    "objectid": self.object_ids[positions],
+                    "score": scores.astype(np.float32),
+                }
+            )
+
+    return (EmbeddingIndex,)
 
 
 @app.cell
-def _(GalleryWidget, get_selection, pdf, pl):
-    GalleryWidget(
-        data=pl.from_pandas(pdf.iloc[get_selection()]),
+def _(EMBEDDINGS_DIR, EmbeddingIndex):
+    embeddings = EmbeddingIndex(EMBEDDINGS_DIR) if EMBEDDINGS_DIR else None
+    return (embeddings,)
+
+
+@app.cell
+def _(GalleryWidget, df, embeddings):
+    gallery = GalleryWidget(
+        data=df,
+        indices=[],
         page_size=20,
+        similar=embeddings.similar if embeddings else None,
     )
-    return
+    gallery
+    return (gallery,)
 
 
 @app.cell
@@ -38,13 +38,10 @@ def _():
 
 
     def load_data() -> pl.DataFrame:
-        # curated set of images in public domain
-        public_domain_ids = [
-            int(id)
-            for id in (pathlib.Path(__file__).parent / "public_domain_ids.txt")
-            .read_text(encoding="utf8")
-            .split("\n")
-        ]
+        # curated set of images in public domain (sorted, see scripts/public_domain.py)
+        public_domain_ids = pl.read_parquet(
+            pathlib.Path(__file__).parent / "public_domain_ids.parquet"
+        ).with_columns(pl.lit(True).alias("public"))
 
         # rest of the public database dump
         url = "https://github.com/NationalGalleryOfArt/opendata/raw/refs/heads/main/data/"
@@ -88,13 +85,12 @@ def _():
             .join(constituents, on="constituentid")
             .join(published_images, on="objectid")
             .join(tsne, on="objectid")
+            .join(public_domain_ids, on="objectid", how="left")
             .select(pl.col("thumburl"), pl.exclude("constituentid", "thumburl"))
-            .with_columns(
-                pl.col("objectid").is_in(public_domain_ids).alias("public")
-            )
+            .with_columns(pl.col("public").fill_null(False))
             .sort(by="year", descending=True, nulls_last=True)
         )
-    return load_data, mo, pl
+    return load_data, mo, pathlib, pl
 
 
 @app.cell(hide_code=True)
@@ -184,7 +180,21 @@ def _(GalleryWidget, subset):
 
 
 @app.cell
-def _(GALLERY_WIDGET_ESM, GALLERY_WIDGET_STYLES, pl):
+def _(pathlib):
+    import sys
+
+    # share encode_ipc, and so the gallery wire format, with 02_explore.py
+    scripts_dir = str(pathlib.Path(__file__).parent.parent / "scripts")
+    if scripts_dir not in sys.path:
+        sys.path.append(scripts_dir)
+    from notebook_module import load_notebook
+
+    encode_ipc = load_notebook("02_explore").encode_ipc
+    return (encode_ipc,)
+
+
+@app.cell
+def _(GALLERY_WIDGET_ESM, GALLERY_WIDGET_STYLES, encode_ipc, pl):
     import anywidget
     import traitlets
 
@@ -192,19 +202,38 @@ def _(GALLERY_WIDGET_ESM, GALLERY_WIDGET_STYLES, pl):
         _esm = GALLERY_WIDGET_ESM
         _css = GALLERY_WIDGET_STYLES
 
+        # the only columns the renderer reads
+        _columns = ("objectid", "thumburl", "title", "public")
+
         _ipc = traitlets.Any().tag(sync=True)
         size = traitlets.Int(100).tag(sync=True)
         page = traitlets.Int(0).tag(sync=True)
         page_size = traitlets.Int(12).tag(sync=True)
+        compression = traitlets.Enum(
+            ["uncompressed", "lz4", "zstd"], "uncompressed"
+        ).tag(sync=True)
 
         def __init__(
-            self, objects: pl.DataFrame, *, size: int = 90, page_size: int = 20
+            self,
+            objects: pl.DataFrame,
+            *,
+            size: int = 90,
+            page_size: int = 20,
+            compression: str = "uncompressed",
         ) -> None:
+            self._objects = objects
             super().__init__(
-                _ipc=objects.write_ipc(None).getvalue(),
+                _ipc=encode_ipc(objects, self._columns, compression=compression),
                 size=size,
                 page=0,
                 page_size=page_size,
+                compression=compression,
+            )
+            self.observe(self._encode, names=["compression"])
+
+        def _encode(self, change) -> None:
+            self._ipc = encode_ipc(
+                self._objects, self._columns, compression=change["new"]
             )
     return (GalleryWidget,)
 
@@ -214,8 +243,23 @@ def _():
     GALLERY_WIDGET_ESM = """
     import * as flech from "https://esm.sh/@uwdata/flechette@2.0.0";
 
-    function render({ model, el }) {
-      let objects = flech.tableFromIPC(new Uint8Array(model.get("_ipc").buffer));
+    const CODECS = {
+      lz4: [flech.CompressionType.LZ4_FRAME, "https://esm.sh/lz4js@0.2.0"],
+      zstd: [flech.CompressionType.ZSTD, "https://esm.sh/fzstd@0.1.1"],
+    };
+
+    async function decode(model) {
+      let name = model.get("compression");
+      if (name in CODECS) {
+        let [type, url] = CODECS[name];
+        let { decompress } = await import(url);
+        flech.setCompressionCodec(type, { decode: (bytes) => decompress(bytes) });
+      }
+      return flech.tableFromIPC(new Uint8Array(model.get("_ipc").buffer));
+    }
+
+    async function render({ model, el }) {
+      let objects = await decode(model);
 
       let container = document.createElement("div");
       container.className = "gallery";
@@ -238,9 +282,28 @@ def _():
       el.appendChild(container);
       el.appendChild(paginationControls);
 
-      function update() {
-        container.replaceChildren();
+      function createItem() {
+        let item = document.createElement("div");
+        item.className = "gallery-item";
+
+        let link = Object.assign(document.createElement("a"), {
+          className: "thumb-link",
+          target: "_blank",
+          rel: "noopener noreferrer",
+        });
+        let img = document.createElement("img");
+        let badge = Object.assign(document.createElement("img"), {
+          src: "https://mirrors.creativecommons.org/presskit/icons/zero.svg",
+          alt: "Public Domain",
+          className: "public-domain-badge",
+        });
+        link.append(img, badge);
+        item.appendChild(link);
+        container.appendChild(item);
+        return item;
+      }
 
+      function update() {
         let size = model.get("size");
         let page = model.get("page");
         let pageSize = model.get("page_size");
@@ -251,37 +314,23 @@ def _():
         let startIdx = page * pageSize;
         let endIdx = Math.min(startIdx + pageSize, objects.numRows);
 
+        // reuse the existing item nodes, only creating or dropping the difference
+        while (container.children.length > endIdx - startIdx) {
+          container.lastChild.remove();
+        }
+
         for (let i = startIdx; i < endIdx; i++) {
           let row = objects.get(i);
-          let item = document.createElement("div");
-          item.className = "gallery-item";
-
-          let link = Object.assign(document.createElement("a"), {
-            className: "thumb-link",
-            href: `https://www.nga.gov/collection/art-object-page.${row.objectid}.html`,
-            target: "_blank",
-            rel: "noopener noreferrer",
-          });
+          let item = container.children[i - startIdx] ?? createItem();
+          let link = item.firstChild;
+          let [img, badge] = link.children;
+
+          link.href = `https://www.nga.gov/collection/art-object-page.${row.objectid}.html`;
           link.style.width = `${size}px`;
           link.style.height = `${size}px`;
-
-          let img = Object.assign(document.createElement("img"), {
-            src: row.thumburl,
-            alt: row.title,
-          });
-          link.appendChild(img);
-
-          if (row.public) {
-            let badge = Object.assign(document.createElement("img"), {
-              src: "https://mirrors.creativecommons.org/presskit/icons/zero.svg",
-              alt: "Public Domain",
-              className: "public-domain-badge",
-            });
-            link.appendChild(badge);
-          }
-
-          item.appendChild(link);
-          container.appendChild(item);
+          img.src = row.thumburl;
+          img.alt = row.title;
+          badge.hidden = !row.public;
         }
 
         pageIndicator.innerText = `Page ${page + 1} of ${totalPages}`;
@@ -313,6 +362,10 @@ def _():
       model.on("change:page", update);
       model.on("change:size", update);
       model.on("change:page_size", update);
+      model.on("change:_ipc", async () => {
+        objects = await decode(model);
+        update();
+      });
     }
 
     export default { render };
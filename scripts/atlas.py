@@ -0,0 +1,165 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "numpy",
+#     "pillow",
+#     "polars",
+#     "tqdm",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Pack downloaded thumbnails into fixed-size sprite atlases.
+
+Writes ``atlas-<n>.jpg`` images plus ``atlas.parquet``, an index from object ID
+to atlas file and sprite rectangle. Sprites are ordered along a Z-order curve
+over the t-SNE layout, so neighbouring artworks tend to share an atlas.
+"""
+
+import argparse
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import polars as pl
+from PIL import Image
+from tqdm import tqdm
+
+SELF_DIR = pathlib.Path(__file__).parent
+
+
+def morton(x: np.ndarray, y: np.ndarray, bits: int = 16) -> np.ndarray:
+    """Interleave the bits of quantized ``x`` and ``y`` coordinates."""
+
+    def quantize(v: np.ndarray) -> np.ndarray:
+        span = max(float(v.max() - v.min()), 1e-9)
+        return ((v - v.min()) / span * ((1 << bits) - 1)).astype(np.uint64)
+
+    qx, qy = quantize(x), quantize(y)
+    code = np.zeros(len(x), dtype=np.uint64)
+    for bit in range(bits):
+        code |= ((qx >> bit) & 1) << (2 * bit)
+        code |= ((qy >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
+def build_atlas(
+    name: str,
+    items: list[tuple[int, str]],
+    cell: int,
+    size: int,
+    quality: int,
+    out: pathlib.Path,
+) -> list[tuple]:
+    """Paste ``items`` (object ID, image path) row by row into one atlas."""
+    atlas = Image.new("RGB", (size, size), "white")
+    per_row = size // cell
+    rows = []
+    for slot, (object_id, path) in enumerate(items):
+        try:
+            with Image.open(path) as image:
+                image.draft("RGB", (cell, cell))
+                sprite = image.convert("RGB")
+                sprite.thumbnail((cell, cell))
+        except OSError as e:
+            print(f"Failed to load {path}: {e}")
+            continue
+        x, y = (slot % per_row) * cell, (slot // per_row) * cell
+        atlas.paste(sprite, (x, y))
+        rows.append((object_id, name, size, x, y, sprite.width, sprite.height))
+    atlas.save(out / name, quality=quality)
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pack thumbnails into sprite atlases with an object ID index."
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=pathlib.Path,
+        default=pathlib.Path("images"),
+        help="Input image directory",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=pathlib.Path,
+        default=pathlib.Path("atlas"),
+        help="Output directory",
+    )
+    parser.add_argument(
+        "--order",
+        type=pathlib.Path,
+        default=SELF_DIR / "../notebooks/tsne.parquet",
+        help="Parquet with objectid, x, y used to order sprites",
+    )
+    parser.add_argument("--cell", type=int, default=128, help="Sprite cell size (px)")
+    parser.add_argument("--size", type=int, default=2048, help="Atlas size (px)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG quality")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Worker processes")
+    args = parser.parse_args()
+
+    paths = {int(p.stem): p for p in args.input.glob("*.jpg")}
+    object_ids = np.array(sorted(paths), dtype=np.int64)
+    if args.order.exists():
+        layout = (
+            pl.read_parquet(args.order)
+            .filter(pl.col("objectid").is_in(object_ids.tolist()))
+            .select("objectid", "x", "y")
+        )
+        ordered = layout["objectid"].to_numpy()[
+            np.argsort(
+                morton(layout["x"].to_numpy(), layout["y"].to_numpy()), kind="stable"
+            )
+        ]
+        rest = np.setdiff1d(object_ids, ordered)
+        object_ids = np.concatenate([ordered, rest])
+
+    per_atlas = (args.size // args.cell) ** 2
+    chunks = [
+        object_ids[start : start + per_atlas]
+        for start in range(0, len(object_ids), per_atlas)
+    ]
+    print(f"Packing {len(object_ids)} images into {len(chunks)} atlases")
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    with ProcessPoolExecutor(args.workers) as pool:
+        futures = [
+            pool.submit(
+                build_atlas,
+                f"atlas-{n:05d}.jpg",
+                [(int(i), str(paths[int(i)])) for i in chunk],
+                args.cell,
+                args.size,
+                args.quality,
+                args.output,
+            )
+            for n, chunk in enumerate(chunks)
+        ]
+        for future in tqdm(futures, desc="Atlases"):
+            rows.extend(future.result())
+
+    index = pl.DataFrame(
+        rows,
+        schema={
+            "objectid": pl.Int32,
+            "atlas": pl.String,
+            "atlas_size": pl.Int32,
+            "sprite_x": pl.Int32,
+            "sprite_y": pl.Int32,
+            "sprite_w": pl.Int32,
+            "sprite_h": pl.Int32,
+        },
+        orient="row",
+    )
+    index.write_parquet(args.output / "atlas.parquet")
+    print(f"Saved {index.height} sprites to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "numpy",
+#     "pillow",
+#     "torch",
+#     "torchvision",
+#     "tqdm",
+#     "transformers",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Benchmark embed.py stage by stage on a synthetic JPEG corpus.
+"""
+
+import argparse
+import io
+import json
+import pathlib
+import platform
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader
+from transformers import (
+    BitImageProcessor,
+    BitImageProcessorFast,
+    Dinov2Config,
+    Dinov2Model,
+)
+
+import embed
+
+SELF_DIR = pathlib.Path(__file__).parent
+
+# DINOv2's preprocessing: shorter side to 256, center crop to 224
+PROCESSOR_CONFIG = dict(
+    size={"shortest_edge": 256},
+    crop_size={"height": 224, "width": 224},
+    image_mean=[0.485, 0.456, 0.406],
+    image_std=[0.229, 0.224, 0.225],
+)
+
+
+def synthetic_corpus(
+    directory: pathlib.Path, n: int, width: int, height: int, seed: int = 42
+) -> list[pathlib.Path]:
+    """Write ``n`` deterministic JPEGs named like the downloader's output."""
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width] / max(width, height)
+    paths = []
+    for i in range(n):
+        path = directory / f"{i}.jpg"
+        paths.append(path)
+        if path.exists():
+            continue
+        # smooth color gradients plus noise, so JPEGs compress like photos
+        a, b, c = rng.random((3, 3, 1, 1))
+        pixels = np.stack([x, y, (x + y) / 2]) * a + b * np.sin(8 * c * (x - y))
+        pixels = pixels.transpose(1, 2, 0) + rng.normal(0, 0.05, (height, width, 3))
+        image = Image.fromarray((np.clip(pixels, 0, 1) * 255).astype(np.uint8))
+        image.save(path, quality=90)
+    return paths
+
+
+def center_crop(image: Image.Image, resize: int, crop: int) -> Image.Image:
+    """Resize the shorter side to ``resize``, then center-crop to ``crop``."""
+    scale = resize / min(image.size)
+    width, height = (max(resize, round(side * scale)) for side in image.size)
+    left, top = (width - crop) // 2, (height - crop) // 2
+    return image.resize((width, height), Image.Resampling.BICUBIC).crop(
+        (left, top, left + crop, top + crop)
+    )
+
+
+def tiny_model(seed: int = 42) -> Dinov2Model:
+    """A randomly initialized, very small DINOv2 (same input shape as the real one)."""
+    torch.manual_seed(seed)
+    config = Dinov2Config(
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=128,
+        image_size=224,
+        patch_size=14,
+    )
+    return Dinov2Model(config).eval()
+
+
+def timed(fn, repeat: int) -> float:
+    """Best wall time of ``fn`` in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("-n", "--images", type=int, default=256, help="Corpus size")
+    parser.add_argument("--width", type=int, default=200, help="Image width")
+    parser.add_argument("--height", type=int, default=160, help="Image height")
+    parser.add_argument(
+        "--corpus",
+        type=pathlib.Path,
+        help="Where to keep the corpus (default: a temporary directory)",
+    )
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument(
+        "--processors",
+        nargs="+",
+        choices=["fast", "slow", "preprocessed"],
+        default=["fast", "slow", "preprocessed"],
+        help="Preprocessing backends: the torchvision-based and PIL-based image "
+        "processors, and embed.py's path for images resized at download time",
+    )
+    parser.add_argument(
+        "--devices",
+        nargs="+",
+        default=["cpu"],
+        help="Devices for the model forward pass (unavailable ones are skipped)",
+    )
+    parser.add_argument(
+        "--model",
+        help="Model name to benchmark instead of the tiny random DINOv2 "
+        "(downloads weights)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+    parser.add_argument("-o", "--output", type=pathlib.Path, help="Write JSON results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = args.corpus or pathlib.Path(tmp) / "images"
+        paths = synthetic_corpus(corpus, args.images, args.width, args.height)
+        n = len(paths)
+        results = []
+
+        def record(stage: str, seconds: float, **params):
+            results.append(
+                {
+                    "stage": stage,
+                    **params,
+                    "seconds": seconds,
+                    "images_per_s": n / seconds,
+                }
+            )
+            described = " ".join(f"{k}={v}" for k, v in params.items())
+            print(f"{stage:<10} {described:<44} {n / seconds:>10.1f} img/s")
+
+        record(
+            "decode",
+            timed(lambda: [Image.open(p).convert("RGB") for p in paths], args.repeat),
+        )
+        images = [Image.open(p).convert("RGB") for p in paths]
+
+        processors = {
+            "fast": BitImageProcessorFast(**PROCESSOR_CONFIG),
+            "slow": BitImageProcessor(**PROCESSOR_CONFIG),
+        }
+        if "preprocessed" in args.processors:
+            # what the downloader's --resize 256 --crop 224 --store-format raw
+            # leaves on disk
+            crops = [
+                np.asarray(center_crop(image, 256, 224)).tobytes() for image in images
+            ]
+            preprocessed = embed.Preprocessed(
+                processors["fast"], 224, raw=True, resize=256
+            )
+            seconds = timed(
+                lambda: [preprocessed(io.BytesIO(crop)) for crop in crops], args.repeat
+            )
+            record("preprocess", seconds, processor="preprocessed")
+        for name in ["fast", "slow"]:
+            if name in args.processors:
+                processor = processors[name]
+                seconds = timed(
+                    lambda: [
+                        processor(images=image, return_tensors="pt") for image in images
+                    ],
+                    args.repeat,
+                )
+                record("preprocess", seconds, processor=name)
+
+        items = [
+            embed.load_item(path, i, processors["fast"]) for i, path in enumerate(paths)
+        ]
+        for batch_size in args.batch_sizes:
+            batches = [items[i : i + batch_size] for i in range(0, n, batch_size)]
+            seconds = timed(lambda: [embed.collate_fn(b) for b in batches], args.repeat)
+            record("collate", seconds, batch_size=batch_size)
+
+        # decode + preprocess + collate in DataLoader workers, as embed.py runs them
+        dataset = embed.ImageFolderDataset(corpus, processors["fast"])
+        for workers in args.workers:
+            for batch_size in args.batch_sizes:
+                loader = DataLoader(
+                    dataset,
+                    batch_size=batch_size,
+                    num_workers=workers,
+                    collate_fn=embed.collate_fn,
+                )
+                seconds = timed(lambda: sum(1 for _ in loader), args.repeat)
+                record("loader", seconds, batch_size=batch_size, workers=workers)
+
+        if args.model:
+            from transformers import AutoModel
+
+            model = AutoModel.from_pretrained(args.model).eval()
+        else:
+            model = tiny_model()
+        pixel_values = torch.stack([item["pixel_values"] for item in items])
+        embeddings = None
+        for device_name in args.devices:
+            if device_name == "cuda" and not torch.cuda.is_available():
+                continue
+            if device_name == "mps" and not torch.backends.mps.is_available():
+                continue
+            device = torch.device(device_name)
+            model = model.to(device)
+            for batch_size in args.batch_sizes:
+
+                def forward():
+                    outputs = []
+                    with torch.no_grad():
+                        for i in range(0, n, batch_size):
+                            batch = pixel_values[i : i + batch_size].to(device)
+                            hidden = model(batch).last_hidden_state.mean(dim=1)
+                            outputs.append(hidden.cpu())
+                    return torch.cat(outputs)
+
+                embeddings = forward().numpy()  # warm-up
+                seconds = timed(forward, args.repeat)
+                record("forward", seconds, batch_size=batch_size, device=device_name)
+
+        if embeddings is not None:
+            output = pathlib.Path(tmp) / "embeddings.npz"
+            object_ids = np.arange(n, dtype=np.int32)
+            seconds = timed(
+                lambda: np.savez_compressed(
+                    output, embeddings=embeddings, object_ids=object_ids
+                ),
+                args.repeat,
+            )
+            record("write", seconds, dim=embeddings.shape[1])
+
+    if args.output:
+        report = {
+            "config": {
+                "images": n,
+                "width": args.width,
+                "height": args.height,
+                "model": args.model or "tiny-random-dinov2",
+                "repeat": args.repeat,
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "threads": torch.get_num_threads(),
+                "machine": platform.machine(),
+            },
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
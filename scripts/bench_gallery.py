@@ -0,0 +1,133 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "marimo",
+#     "numpy",
+#     "polars",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Benchmark GalleryWidget page payloads: bytes on the wire and encode/decode time.
+"""
+
+import argparse
+import json
+import pathlib
+import time
+
+import numpy as np
+import polars as pl
+
+from notebook_module import load_notebook
+
+SELF_DIR = pathlib.Path(__file__).parent
+
+# columns read by the GalleryWidget renderer in 02_explore.py
+GALLERY_COLUMNS = [
+    "objectid",
+    "thumbnail",
+    "iiif_url",
+    "title",
+    "artist",
+    "date",
+    "medium",
+    "type",
+    "width",
+    "height",
+]
+
+
+def synthetic_artworks(n: int, seed: int = 42) -> pl.DataFrame:
+    """A frame shaped like the notebook's artworks table."""
+    rng = np.random.default_rng(seed)
+    uuids = [f"{i:08x}-{rng.integers(1 << 16):04x}" for i in range(n)]
+    iiif = [f"https://api.nga.gov/iiif/{uuid}" for uuid in uuids]
+    return pl.DataFrame(
+        {
+            "objectid": np.arange(n, dtype=np.int32),
+            "thumbnail": [f"{url}/full/!200,200/0/default.jpg" for url in iiif],
+            "iiif_url": iiif,
+            "title": [f"Untitled {i}" for i in rng.integers(0, n, n)],
+            "artist": [f"Artist {i}" for i in rng.zipf(1.5, n) % 5000],
+            "artist_nationality": rng.choice(["American", "French", "Dutch"], n),
+            "date": [str(y) for y in rng.integers(1400, 2000, n)],
+            "beginyear": rng.integers(1400, 2000, n),
+            "medium": rng.choice(
+                ["etching", "oil on canvas", "gelatin silver print"], n
+            ),
+            "type": rng.choice(["print", "painting", "drawing", "photograph"], n),
+            "width": rng.integers(100, 4000, n),
+            "height": rng.integers(100, 4000, n),
+            "public": rng.random(n) < 0.5,
+            "x": rng.normal(size=n).astype(np.float32),
+            "y": rng.normal(size=n).astype(np.float32),
+        }
+    )
+
+
+def measure(fn, repeat: int) -> float:
+    """Best wall time of ``fn`` in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        "-i", "--input", type=pathlib.Path, help="Artworks parquet (default: synthetic)"
+    )
+    parser.add_argument("-n", "--rows", type=int, default=50_000, help="Synthetic rows")
+    parser.add_argument(
+        "--page-sizes", type=int, nargs="+", default=[15, 20, 60, 200, 1000]
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions")
+    parser.add_argument("-o", "--output", type=pathlib.Path, help="Write JSON results")
+    args = parser.parse_args()
+
+    notebook = load_notebook("02_explore")
+    frame = pl.read_parquet(args.input) if args.input else synthetic_artworks(args.rows)
+
+    variants = {
+        "all columns": dict(columns=None, compression="uncompressed"),
+        "projected": dict(columns=GALLERY_COLUMNS, compression="uncompressed"),
+        "projected+lz4": dict(columns=GALLERY_COLUMNS, compression="lz4"),
+        "projected+zstd": dict(columns=GALLERY_COLUMNS, compression="zstd"),
+    }
+
+    results = []
+    print(
+        f"{'page size':>9}  {'variant':<16} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}"
+    )
+    for page_size in args.page_sizes:
+        page = frame.sample(min(page_size, frame.height), seed=0)
+        for name, options in variants.items():
+            payload = notebook.encode_ipc(page, **options)
+            encode = measure(lambda: notebook.encode_ipc(page, **options), args.repeat)
+            decode = measure(lambda: pl.read_ipc(payload), args.repeat)
+            results.append(
+                {
+                    "page_size": page_size,
+                    "variant": name,
+                    "bytes": len(payload),
+                    "encode_ms": encode,
+                    "decode_ms": decode,
+                }
+            )
+            print(
+                f"{page_size:>9}  {name:<16} {len(payload):>10,} {encode:>10.3f} {decode:>10.3f}"
+            )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "httpx",
+#     "marimo",
+#     "polars",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Write the downloader's input CSV (``objectid,thumburl``) from the NGA tables.
+
+Uses the same primary-image selection as the notebooks' loader, imported from
+``notebooks/02_explore.py``. The source tables are streamed to disk and the
+list is built with a lazy query and written with ``sink_csv``, so neither is
+held in memory as a whole.
+"""
+
+import argparse
+import json
+import pathlib
+
+import httpx
+import polars as pl
+
+from notebook_module import load_notebook
+
+SELF_DIR = pathlib.Path(__file__).parent
+
+NGA_BASE = "https://raw.githubusercontent.com/NationalGalleryOfArt/opendata/main/data"
+
+
+def fetch_table(base: str, name: str, cache_dir: pathlib.Path) -> pathlib.Path:
+    """Stream ``<base>/<name>.csv`` to ``cache_dir`` and return its path."""
+    path = cache_dir / f"{name}.csv"
+    part = path.with_suffix(".csv.part")
+    with httpx.stream(
+        "GET", f"{base}/{name}.csv", follow_redirects=True, timeout=120
+    ) as response:
+        response.raise_for_status()
+        with part.open("wb") as f:
+            for chunk in response.iter_bytes():
+                f.write(chunk)
+    part.replace(path)
+    return path
+
+
+def read_ids(path: pathlib.Path) -> pl.LazyFrame:
+    """Read newline-delimited object IDs from a text file."""
+    return pl.scan_csv(
+        path, has_header=False, new_columns=["objectid"], schema_overrides=[pl.Int32]
+    )
+
+
+def downloaded_ids(output: pathlib.Path) -> pl.LazyFrame:
+    """Object IDs recorded in the downloader's manifest for ``output``."""
+    manifest = output / "manifest.csv"
+    if not manifest.exists():
+        return pl.LazyFrame(schema={"objectid": pl.Int32})
+    return pl.scan_csv(manifest).select(pl.col("id").cast(pl.Int32).alias("objectid"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build the downloader's input CSV from the NGA open data."
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=pathlib.Path,
+        default=SELF_DIR / "art.csv",
+        help="Output CSV (objectid,thumburl)",
+    )
+    parser.add_argument("--base", default=NGA_BASE, help="Base URL of the NGA tables")
+    parser.add_argument(
+        "--cache-dir",
+        type=pathlib.Path,
+        default=SELF_DIR / "nga",
+        help="Where to keep the downloaded source tables",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Reuse the tables in --cache-dir instead of downloading them",
+    )
+    parser.add_argument(
+        "--public", action="store_true", help="Only public domain (open access) images"
+    )
+    parser.add_argument(
+        "--skip-downloaded",
+        type=pathlib.Path,
+        metavar="IMAGES_DIR",
+        help="Leave out IDs already in IMAGES_DIR/manifest.csv",
+    )
+    parser.add_argument(
+        "--ids",
+        type=pathlib.Path,
+        action="append",
+        default=[],
+        help="Only IDs listed in this file, e.g. changed_ids.txt (repeatable)",
+    )
+    args = parser.parse_args()
+
+    explore = load_notebook("02_explore")
+
+    args.cache_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name in ["objects", "published_images"]:
+        path = args.cache_dir / f"{name}.csv"
+        if not (args.offline and path.exists()):
+            print(f"Fetching {name}.csv")
+            path = fetch_table(args.base, name, args.cache_dir)
+        paths[name] = path
+
+    # same schema inference as the notebooks' loader
+    images = pl.scan_csv(paths["published_images"], infer_schema_length=10000)
+    objects = pl.scan_csv(paths["objects"], infer_schema_length=10000)
+
+    query = (
+        explore.primary_thumbnails(images)
+        .filter(pl.col("thumbnail").is_not_null())
+        .with_columns(pl.col("objectid").cast(pl.Int32))
+        .join(
+            objects.select(pl.col("objectid").cast(pl.Int32)),
+            on="objectid",
+            how="semi",
+        )
+    )
+    if args.public:
+        query = query.filter(pl.col("public_domain") == 1)
+    if args.ids:
+        query = query.join(
+            pl.concat([read_ids(path) for path in args.ids]),
+            on="objectid",
+            how="semi",
+        )
+    if args.skip_downloaded:
+        query = query.join(
+            downloaded_ids(args.skip_downloaded), on="objectid", how="anti"
+        )
+
+    query.select("objectid", pl.col("thumbnail").alias("thumburl")).sort(
+        "objectid"
+    ).sink_csv(args.output)
+    # tells the downloader's --sync whether missing IDs were removed upstream
+    filters = [
+        *(["--public"] if args.public else []),
+        *(f"--ids {path}" for path in args.ids),
+        *(
+            [f"--skip-downloaded {args.skip_downloaded}"]
+            if args.skip_downloaded
+            else []
+        ),
+    ]
+    args.output.with_suffix(".json").write_text(
+        json.dumps({"complete": not filters, "filters": filters}, indent=2) + "\n"
+    )
+    count = pl.scan_csv(args.output).select(pl.len()).collect().item()
+    print(f"Wrote {count} images to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
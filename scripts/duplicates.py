@@ -0,0 +1,204 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "numpy",
+#     "pillow",
+#     "polars",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Report exact and near-duplicate images among the downloads.
+
+Exact duplicates come from the SHA-256 hashes in the downloader's manifest
+(the same grouping ``embed.py`` uses to embed each image once). Near
+duplicates, such as re-scans of the same print or placeholder thumbnails, are
+found by comparing 64-bit difference hashes (dHash) of the unique images.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import mmap
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import polars as pl
+from PIL import Image
+
+SELF_DIR = pathlib.Path(__file__).parent
+
+# set bits in each byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(
+    axis=1, dtype=np.uint8
+)
+# side of the hash blocks compared at once (BLOCK**2 * 8 bytes of XORs)
+BLOCK = 1024
+
+
+def raw_size(image_dir: pathlib.Path) -> int | None:
+    """Side length of raw RGB images (``--store-format raw``), else ``None``."""
+    preprocess = image_dir / "preprocess.json"
+    if not preprocess.exists():
+        return None
+    settings = json.loads(preprocess.read_text())
+    return settings["size"] if settings["format"] == "raw" else None
+
+
+def image_sources(image_dir: pathlib.Path, suffix: str) -> dict[int, object]:
+    """
+    Object ID -> path of each image, or ``(mapped shard, offset, length)``
+    for images in shards. Shard members are only read when hashed.
+    """
+    index = image_dir / "index.csv"
+    if not index.exists():
+        return {int(path.stem): path for path in image_dir.glob(f"*{suffix}")}
+
+    sources, maps = {}, {}
+    with open(index, newline="") as f:
+        for row in csv.DictReader(f):
+            shard = row["shard"]
+            if shard not in maps:
+                with open(image_dir / shard, "rb") as shard_file:
+                    maps[shard] = mmap.mmap(
+                        shard_file.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+            sources[int(row["id"])] = (
+                maps[shard],
+                int(row["offset"]),
+                int(row["length"]),
+            )
+    return sources
+
+
+def open_image(source, size: int | None) -> Image.Image:
+    if isinstance(source, pathlib.Path):
+        source = source.read_bytes()
+    else:
+        shard, offset, length = source
+        source = shard[offset : offset + length]
+    if size is not None:
+        return Image.frombytes("RGB", (size, size), source)
+    return Image.open(io.BytesIO(source))
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: signs of horizontal gradients on a 9x8 thumbnail."""
+    pixels = np.asarray(
+        image.convert("L").resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16
+    )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    """Number of set bits in each element of a contiguous uint64 array."""
+    return POPCOUNT[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def near_pairs(hashes: np.ndarray, threshold: int) -> list[tuple[int, int, int]]:
+    """
+    Index pairs of ``hashes`` at Hamming distance ``<= threshold``.
+
+    Splits the 64 bits into ``threshold + 1`` bands; by pigeonhole any pair
+    within the threshold agrees on at least one band, so only hashes sharing
+    a band value are compared.
+    """
+    bands = threshold + 1
+    edges = np.linspace(0, 64, bands + 1).astype(int)
+    pairs = set()
+    for lo, hi in itertools.pairwise(edges):
+        keys = (hashes >> np.uint64(64 - hi)) & np.uint64((1 << (hi - lo)) - 1)
+        order = np.argsort(keys, kind="stable")
+        starts = np.flatnonzero(np.diff(keys[order], prepend=~keys[order][:1]))
+        for group in np.split(order, starts[1:]):
+            # compare in square blocks on and above the diagonal, so even a
+            # group of thousands of identical placeholders stays small
+            for r in range(0, len(group) - 1, BLOCK):
+                rows = group[r : r + BLOCK]
+                for c in range(r, len(group), BLOCK):
+                    cols = group[c : c + BLOCK]
+                    distance = popcount(hashes[rows][:, None] ^ hashes[cols][None, :])
+                    for i, j in zip(*np.nonzero(distance <= threshold)):
+                        if r + i < c + j:
+                            pairs.add((int(rows[i]), int(cols[j]), int(distance[i, j])))
+    return sorted(pairs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Find exact and near-duplicate downloaded images."
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=pathlib.Path,
+        default=SELF_DIR / "images",
+        help="Image directory (loose files or shards with index.csv)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=pathlib.Path,
+        default=SELF_DIR / "duplicates",
+        help="Output directory for the reports",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=int,
+        default=4,
+        help="Maximum dHash Hamming distance for near duplicates",
+    )
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Hashing threads")
+    args = parser.parse_args()
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    size = raw_size(args.input)
+    sources = image_sources(args.input, ".jpg" if size is None else ".rgb")
+    manifest = pl.read_csv(args.input / "manifest.csv").select(
+        pl.col("id").cast(pl.Int32).alias("objectid"), "sha256"
+    )
+    exact = (
+        manifest.filter(pl.col("objectid").is_in(list(sources)))
+        .with_columns(canonical=pl.col("objectid").min().over("sha256"))
+        .sort("objectid")
+    )
+    exact.write_csv(args.output / "exact.csv")
+    copies = exact.filter(pl.col("objectid") != pl.col("canonical")).height
+    print(f"{copies} of {exact.height} images are exact copies of another")
+
+    # one dHash per unique image
+    unique = exact.filter(pl.col("objectid") == pl.col("canonical"))
+    ids = unique.get_column("objectid").to_list()
+    with ThreadPoolExecutor(args.workers) as pool:
+        hashes = np.array(
+            list(
+                pool.map(lambda obj_id: dhash(open_image(sources[obj_id], size)), ids)
+            ),
+            dtype=np.uint64,
+        )
+
+    pairs = near_pairs(hashes, args.threshold)
+    near = pl.DataFrame(
+        {
+            "a": [ids[i] for i, _, _ in pairs],
+            "b": [ids[j] for _, j, _ in pairs],
+            "distance": [d for _, _, d in pairs],
+        },
+        schema={"a": pl.Int32, "b": pl.Int32, "distance": pl.UInt8},
+    )
+    near.write_csv(args.output / "near.csv")
+    print(
+        f"{near.height} near-duplicate pairs (distance <= {args.threshold}) "
+        f"among {len(ids)} unique images, written to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,44 +16,307 @@ Batch image embedding script using DINOv2.
 """
 
 import argparse
+import csv
+import io
+import json
+import mmap
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 import torch
 from PIL import Image
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, IterableDataset, get_worker_info
 from tqdm import tqdm
 from transformers import AutoImageProcessor, AutoModel
 
 
+def size_field(size, key: str) -> int | None:
+    """``key`` of a processor size setting (a dict, or a fast processor's SizeDict)."""
+    if isinstance(size, dict):
+        return size.get(key)
+    return getattr(size, key, None)
+
+
+class Preprocessed:
+    """
+    Stand-in for the image processor when the downloader already resized and
+    center-cropped the images (``--resize``/``--crop``), so only rescaling
+    and normalization are left to do.
+
+    Raises ``ValueError`` if the download-time ``resize`` and crop ``size``
+    differ from what ``processor`` would do, since the model would then see
+    different pixels than in a normal run.
+    """
+
+    def __init__(self, processor, size: int, raw: bool, resize: int | None = None):
+        crop = getattr(processor, "crop_size", None)
+        crop = (size_field(crop, "height"), size_field(crop, "width"))
+        if crop != (size, size):
+            raise ValueError(
+                f"Images were cropped to {size}x{size} at download time, but the "
+                f"processor crops to {crop[0]}x{crop[1]}"
+            )
+        shortest_edge = size_field(getattr(processor, "size", None), "shortest_edge")
+        if resize is not None and shortest_edge is not None and resize != shortest_edge:
+            raise ValueError(
+                f"Images were resized to {resize}px at download time, but the "
+                f"processor resizes to {shortest_edge}px"
+            )
+        self.mean = torch.tensor(processor.image_mean).view(3, 1, 1)
+        self.std = torch.tensor(processor.image_std).view(3, 1, 1)
+        self.size = size
+        self.raw = raw
+
+    def __call__(self, source) -> torch.Tensor:
+        if self.raw:
+            data = source.read() if hasattr(source, "read") else source.read_bytes()
+            if len(data) != self.size * self.size * 3:
+                raise ValueError(
+                    f"{len(data)} bytes is not a {self.size}x{self.size} RGB image"
+                )
+            pixels = np.frombuffer(data, np.uint8).reshape(self.size, self.size, 3)
+        else:
+            image = Image.open(source)
+            if image.size != (self.size, self.size):
+                raise ValueError(
+                    f"Image is {image.width}x{image.height}, "
+                    f"expected {self.size}x{self.size}"
+                )
+            pixels = np.asarray(image.convert("RGB"))
+        tensor = torch.from_numpy(pixels.copy()).permute(2, 0, 1).float().div_(255)
+        return (tensor - self.mean) / self.std
+
+
+def load_item(source, obj_id: int, processor) -> dict:
+    """Decode and preprocess one image from a path or file-like object."""
+    try:
+        if isinstance(processor, Preprocessed):
+            pixel_values = processor(source)
+        else:
+            image = Image.open(source).convert("RGB")
+            inputs = processor(images=image, return_tensors="pt")
+            pixel_values = inputs["pixel_values"].squeeze(0)
+        return {"pixel_values": pixel_values, "object_id": obj_id, "valid": True}
+    except Exception as e:
+        # Return a dummy tensor for failed images
+        print(f"Failed to load {obj_id}: {e}")
+        size = processor.size if isinstance(processor, Preprocessed) else 224
+        return {
+            "pixel_values": torch.zeros(3, size, size),
+            "object_id": obj_id,
+            "valid": False,
+        }
+
+
 class ImageFolderDataset(Dataset):
     """Dataset that loads images from a folder."""
 
-    def __init__(self, image_dir: Path, processor):
+    def __init__(self, image_dir: Path, processor, suffix: str = ".jpg"):
         self.processor = processor
-        self.image_paths = sorted(image_dir.glob("*.jpg"))
+        self.image_paths = sorted(image_dir.glob(f"*{suffix}"))
         self.object_ids = [int(f.stem) for f in self.image_paths]
 
     def __len__(self):
         return len(self.image_paths)
 
+    def drop(self, object_ids: set[int]):
+        keep = [
+            i for i, obj_id in enumerate(self.object_ids) if obj_id not in object_ids
+        ]
+        self.image_paths = [self.image_paths[i] for i in keep]
+        self.object_ids = [self.object_ids[i] for i in keep]
+
     def __getitem__(self, idx):
-        path = self.image_paths[idx]
-        obj_id = self.object_ids[idx]
+        return load_item(self.image_paths[idx], self.object_ids[idx], self.processor)
+
+
+def read_shard_index(shard_dir: Path) -> dict[str, list[tuple[int, int, int]]]:
+    """
+    Read ``index.csv`` written by the downloader's ``--shard-size`` mode.
+
+    Returns ``(object_id, offset, length)`` entries grouped by shard, in file
+    order, keeping only the latest entry for each object ID.
+    """
+    latest = {}
+    with open(shard_dir / "index.csv", newline="") as f:
+        for row in csv.DictReader(f):
+            latest[int(row["id"])] = (
+                row["shard"],
+                int(row["offset"]),
+                int(row["length"]),
+            )
+    shards = {}
+    for obj_id, (shard, offset, length) in latest.items():
+        shards.setdefault(shard, []).append((obj_id, offset, length))
+    return {
+        shard: sorted(entries, key=lambda entry: entry[1])
+        for shard, entries in sorted(shards.items())
+    }
+
+
+class ShardDataset(Dataset):
+    """Dataset that reads images out of memory-mapped tar shards."""
+
+    def __init__(self, shard_dir: Path, processor):
+        self.processor = processor
+        self.shard_dir = shard_dir
+        self.entries = [
+            (shard, *entry)
+            for shard, entries in read_shard_index(shard_dir).items()
+            for entry in entries
+        ]
+        self.object_ids = [entry[1] for entry in self.entries]
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def drop(self, object_ids: set[int]):
+        self.entries = [entry for entry in self.entries if entry[1] not in object_ids]
+        self.object_ids = [entry[1] for entry in self.entries]
+
+    def _map(self, shard: str) -> mmap.mmap:
+        # Opened lazily so each DataLoader worker gets its own mappings
+        if shard not in self._maps:
+            with open(self.shard_dir / shard, "rb") as f:
+                self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[shard]
+
+    def __getitem__(self, idx):
+        shard, obj_id, offset, length = self.entries[idx]
+        data = self._map(shard)[offset : offset + length]
+        return load_item(io.BytesIO(data), obj_id, self.processor)
+
+
+class ShardStreamDataset(IterableDataset):
+    """
+    Dataset that reads whole tar shards sequentially, one shard at a time.
+
+    Shards are split between DataLoader workers, so output order differs from
+    the index order when ``num_workers > 1``.
+    """
 
+    def __init__(self, shard_dir: Path, processor):
+        self.processor = processor
+        self.shard_dir = shard_dir
+        self.shards = list(read_shard_index(shard_dir).items())
+        self.object_ids = [
+            obj_id for _, entries in self.shards for obj_id, _, _ in entries
+        ]
+
+    def __len__(self):
+        return len(self.object_ids)
+
+    def drop(self, object_ids: set[int]):
+        self.shards = [
+            (shard, [entry for entry in entries if entry[0] not in object_ids])
+            for shard, entries in self.shards
+        ]
+        self.object_ids = [
+            obj_id for obj_id in self.object_ids if obj_id not in object_ids
+        ]
+
+    def __iter__(self):
+        worker = get_worker_info()
+        shards = self.shards
+        if worker is not None:
+            shards = shards[worker.id :: worker.num_workers]
+        for shard, entries in shards:
+            data = (self.shard_dir / shard).read_bytes()
+            for obj_id, offset, length in entries:
+                source = io.BytesIO(data[offset : offset + length])
+                yield load_item(source, obj_id, self.processor)
+
+
+def read_hashes(manifest: Path) -> dict[int, str]:
+    """Object ID -> SHA-256 of the downloaded image, from the downloader's manifest."""
+    with open(manifest, newline="") as f:
+        return {int(row["id"]): row["sha256"] for row in csv.DictReader(f)}
+
+
+def find_duplicates(object_ids, hashes: dict[int, str]) -> dict[int, list[int]]:
+    """
+    Group ``object_ids`` by image hash.
+
+    Returns the lowest ID of each group with more than one member (the one to
+    embed), mapped to the other IDs sharing its image. IDs without a hash are
+    treated as unique.
+    """
+    groups = {}
+    for obj_id in sorted(object_ids):
+        if obj_id in hashes:
+            groups.setdefault(hashes[obj_id], []).append(obj_id)
+    return {ids[0]: ids[1:] for ids in groups.values() if len(ids) > 1}
+
+
+def stream_batches(
+    lines,
+    processor,
+    batch_size: int,
+    workers: int,
+    wait: float = 1.0,
+    duplicates: dict[int, list[int]] | None = None,
+):
+    """
+    Batch images named on ``lines`` (``<object id>\t<path>[\t<sha256>]``) as
+    they arrive.
+
+    Lines are read and decoded on a thread pool in the background, so decoding
+    overlaps with the model. A partial batch is yielded once no new image has
+    arrived for ``wait`` seconds, and the rest when ``lines`` ends. Images
+    whose hash was already seen are not decoded again; they are recorded in
+    ``duplicates`` (first ID -> other IDs) instead.
+    """
+    # bounded, so a slow model pushes back on the reader instead of buffering
+    pending = queue.Queue(maxsize=4 * batch_size)
+    done = object()
+
+    first = {}
+    failure = []
+
+    def read(pool):
         try:
-            image = Image.open(path).convert("RGB")
-            inputs = self.processor(images=image, return_tensors="pt")
-            pixel_values = inputs["pixel_values"].squeeze(0)
-            return {"pixel_values": pixel_values, "object_id": obj_id, "valid": True}
-        except Exception as e:
-            # Return a dummy tensor for failed images
-            print(f"Failed to load {path}: {e}")
-            return {
-                "pixel_values": torch.zeros(3, 224, 224),
-                "object_id": obj_id,
-                "valid": False,
-            }
+            for line in lines:
+                if not line.strip():
+                    continue
+                obj_id, path, *digest = line.rstrip("\n").split("\t")
+                obj_id = int(obj_id)
+                if digest and duplicates is not None:
+                    if digest[0] in first:
+                        duplicates.setdefault(first[digest[0]], []).append(obj_id)
+                        continue
+                    first[digest[0]] = obj_id
+                pending.put(pool.submit(load_item, Path(path), obj_id, processor))
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            # always wake the consumer, which re-raises any failure
+            pending.put(done)
+
+    with ThreadPoolExecutor(max(workers, 1)) as pool:
+        threading.Thread(target=read, args=(pool,), daemon=True).start()
+        batch = []
+        while True:
+            try:
+                item = pending.get(timeout=wait if batch else None)
+            except queue.Empty:
+                yield collate_fn([future.result() for future in batch])
+                batch = []
+                continue
+            if item is done:
+                if failure:
+                    raise failure[0]
+                break
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield collate_fn([future.result() for future in batch])
+                batch = []
+        if batch:
+            yield collate_fn([future.result() for future in batch])
 
 
 def collate_fn(batch):
@@ -85,6 +348,23 @@ def main():
     parser.add_argument(
         "--model", type=str, default="facebook/dinov2-base", help="Model name"
     )
+    parser.add_argument(
+        "--shard-read",
+        choices=["mmap", "sequential"],
+        default="mmap",
+        help="How to read tar shards when the input has an index.csv",
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Embed every image, even if the manifest says it is identical to another",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Embed images named on stdin as '<id>\\t<path>' lines as they "
+        "arrive, e.g. from the downloader's --emit -",
+    )
     args = parser.parse_args()
 
     # Device setup
@@ -105,25 +385,68 @@ def main():
     model = model.to(device)
     model.eval()
 
-    # Create dataset
-    dataset = ImageFolderDataset(args.input, processor)
-    print(f"Found {len(dataset)} images to process")
-
-    dataloader = DataLoader(
-        dataset,
-        batch_size=args.batch_size,
-        shuffle=False,
-        num_workers=args.workers,
-        collate_fn=collate_fn,
-        pin_memory=True if device.type == "cuda" else False,
-    )
+    # Images resized by the downloader skip decode-and-resize work
+    suffix = ".jpg"
+    preprocess_path = args.input / "preprocess.json"
+    if preprocess_path.exists():
+        preprocess = json.loads(preprocess_path.read_text())
+        raw = preprocess["format"] == "raw"
+        # older downloads resized straight to the crop size
+        resize = preprocess.get("resize", preprocess["size"])
+        try:
+            processor = Preprocessed(processor, preprocess["size"], raw, resize)
+        except ValueError as e:
+            sys.exit(f"{preprocess_path} does not match {args.model}: {e}")
+        suffix = ".rgb" if raw else ".jpg"
+        print(
+            f"Images are preprocessed to {preprocess['size']}px ({preprocess['format']})"
+        )
+
+    # Create dataset (tar shards if the downloader wrote an index)
+    duplicates = {}
+    if args.stream:
+        print("Reading images from stdin")
+        batches = stream_batches(
+            sys.stdin,
+            processor,
+            args.batch_size,
+            args.workers,
+            duplicates=None if args.no_dedup else duplicates,
+        )
+    elif (args.input / "index.csv").exists():
+        if args.shard_read == "mmap":
+            dataset = ShardDataset(args.input, processor)
+        else:
+            dataset = ShardStreamDataset(args.input, processor)
+    else:
+        dataset = ImageFolderDataset(args.input, processor, suffix)
+
+    if not args.stream:
+        # Identical downloads (same SHA-256 in the manifest) are embedded once
+        manifest = args.input / "manifest.csv"
+        if manifest.exists() and not args.no_dedup:
+            duplicates = find_duplicates(dataset.object_ids, read_hashes(manifest))
+            dataset.drop({d for ids in duplicates.values() for d in ids})
+            print(
+                f"Skipping {sum(map(len, duplicates.values()))} duplicate images "
+                f"of {len(duplicates)} unique ones"
+            )
+        print(f"Found {len(dataset)} images to process")
+        batches = DataLoader(
+            dataset,
+            batch_size=args.batch_size,
+            shuffle=False,
+            num_workers=args.workers,
+            collate_fn=collate_fn,
+            pin_memory=True if device.type == "cuda" else False,
+        )
 
     # Process batches
     all_embeddings = []
     all_object_ids = []
 
     with torch.no_grad():
-        for batch in tqdm(dataloader, desc="Embedding"):
+        for batch in tqdm(batches, desc="Embedding"):
             pixel_values = batch["pixel_values"].to(device)
             object_ids = batch["object_ids"]
             valid_mask = batch["valid_mask"]
@@ -141,6 +464,13 @@ def main():
                     all_embeddings.append(emb)
                     all_object_ids.append(obj_id)
 
+    # Give duplicates the embedding of the image they share
+    position = {obj_id: i for i, obj_id in enumerate(all_object_ids)}
+    for obj_id, others in duplicates.items():
+        if obj_id in position:
+            all_embeddings.extend([all_embeddings[position[obj_id]]] * len(others))
+            all_object_ids.extend(others)
+
     # Save results
     print(f"Saving {len(all_object_ids)} embeddings to {args.output}")
     np.savez_compressed(
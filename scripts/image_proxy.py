@@ -0,0 +1,323 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "httpx",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Local caching proxy for artwork images.
+
+An image URL like ``https://api.nga.gov/iiif/<id>/full/!200,200/0/default.jpg``
+is requested as ``http://localhost:8910/https/api.nga.gov/iiif/<id>/...``.
+Responses are kept in a size-capped LRU disk cache, concurrent requests for
+the same URL share one upstream fetch, and entries older than ``--max-age``
+are revalidated with ETag/Last-Modified. Thumbnails the downloader already
+fetched are served straight from its output directory, and sprite atlases
+built by ``atlas.py`` are served under ``/atlas/``.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+
+class DiskCache:
+    """Response bodies and metadata on disk, evicted least recently used first."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        # body mtimes are bumped on every hit, so they restore the LRU order
+        for path in sorted(root.glob("*.bin"), key=lambda p: p.stat().st_mtime):
+            self._entries[path.stem] = path.stat().st_size
+            self._size += self._entries[path.stem]
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        return self.root / f"{key}.bin", self.root / f"{key}.json"
+
+    def get(self, key: str) -> tuple[bytes, dict] | None:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        body_path, meta_path = self._paths(key)
+        try:
+            body = body_path.read_bytes()
+            meta = json.loads(meta_path.read_text())
+            os.utime(body_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._remove(key)
+            return None
+        return body, meta
+
+    def put(self, key: str, body: bytes, meta: dict) -> None:
+        body_path, meta_path = self._paths(key)
+        tmp_path = body_path.with_suffix(".tmp")
+        tmp_path.write_bytes(body)
+        meta_path.write_text(json.dumps(meta))
+        tmp_path.replace(body_path)
+        with self._lock:
+            self._size += len(body) - self._entries.pop(key, 0)
+            self._entries[key] = len(body)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                oldest, size = self._entries.popitem(last=False)
+                self._size -= size
+                for path in self._paths(oldest):
+                    path.unlink(missing_ok=True)
+
+    def update_meta(self, key: str, meta: dict) -> None:
+        self._paths(key)[1].write_text(json.dumps(meta))
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        for path in self._paths(key):
+            path.unlink(missing_ok=True)
+
+
+class ImageProxy:
+    """Resolve image URLs from local files, the disk cache, or upstream."""
+
+    def __init__(
+        self,
+        cache: DiskCache,
+        client: httpx.Client | None,
+        *,
+        max_age: float,
+        local_files: dict[str, Path],
+    ):
+        self.cache = cache
+        self.client = client
+        self.max_age = max_age
+        self.local_files = local_files
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+
+    def fetch(self, url: str) -> tuple[int, bytes, str]:
+        """Return ``(status, body, content_type)`` for ``url``."""
+        local = self.local_files.get(url)
+        if local is not None and local.exists():
+            return 200, local.read_bytes(), "image/jpeg"
+
+        key = hashlib.sha256(url.encode()).hexdigest()
+        entry = self.cache.get(key)
+        if entry is not None and (
+            self.client is None or time.time() - entry[1]["fetched"] < self.max_age
+        ):
+            return 200, entry[0], entry[1]["content_type"]
+        if self.client is None:
+            return 504, b"not cached (offline)", "text/plain"
+        return self._coalesce(key, lambda: self._fetch_upstream(url, key, entry))
+
+    def _coalesce(self, key: str, fetch) -> tuple[int, bytes, str]:
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _fetch_upstream(
+        self, url: str, key: str, entry: tuple[bytes, dict] | None
+    ) -> tuple[int, bytes, str]:
+        assert self.client is not None
+        headers = {}
+        if entry is not None:
+            if etag := entry[1].get("etag"):
+                headers["If-None-Match"] = etag
+            if last_modified := entry[1].get("last_modified"):
+                headers["If-Modified-Since"] = last_modified
+
+        try:
+            response = self.client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            if entry is not None:
+                # serve stale rather than fail when upstream is unreachable
+                return 200, entry[0], entry[1]["content_type"]
+            return 502, str(e).encode(), "text/plain"
+
+        if response.status_code == 304 and entry is not None:
+            meta = {**entry[1], "fetched": time.time()}
+            self.cache.update_meta(key, meta)
+            return 200, entry[0], meta["content_type"]
+        content_type = response.headers.get("content-type", "application/octet-stream")
+        if response.status_code != 200:
+            return response.status_code, response.content, content_type
+
+        meta = {
+            "url": url,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "content_type": content_type,
+            "fetched": time.time(),
+        }
+        self.cache.put(key, response.content, meta)
+        return 200, response.content, content_type
+
+
+def read_local_files(index: Path, images: Path) -> dict[str, Path]:
+    """
+    Map thumbnail URLs to files fetched by the downloader (``<id>.jpg``).
+
+    Nothing is mapped if the downloader resized its images (``--resize``
+    leaves a ``preprocess.json``): those are center crops, not the
+    thumbnails the URLs name.
+    """
+    if (images / "preprocess.json").exists():
+        return {}
+    with index.open(newline="") as f:
+        return {
+            row["thumburl"]: images / f"{row['objectid']}.jpg"
+            for row in csv.DictReader(f)
+        }
+
+
+def make_handler(
+    proxy: ImageProxy, allowed_hosts: set[str], atlas_dir: Path | None = None
+):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            scheme, _, rest = self.path.lstrip("/").partition("/")
+            if scheme == "atlas":
+                self._send_atlas(rest)
+                return
+            host = rest.partition("/")[0]
+            if scheme not in ("http", "https") or host not in allowed_hosts:
+                self._respond(403, b"host not allowed", "text/plain")
+                return
+            self._respond(*proxy.fetch(f"{scheme}://{rest}"))
+
+        def _send_atlas(self, name: str):
+            path = atlas_dir / name if atlas_dir is not None else None
+            if path is None or path.name != name or not path.is_file():
+                self._respond(404, b"no such atlas", "text/plain")
+                return
+            self._respond(200, path.read_bytes(), "image/jpeg")
+
+        def _respond(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            if status == 200:
+                self.send_header("Cache-Control", "public, max-age=86400")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve artwork images through a local caching proxy."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("-p", "--port", type=int, default=8910, help="Port to bind")
+    parser.add_argument(
+        "--cache-dir", type=Path, default=Path(".image-cache"), help="Cache directory"
+    )
+    parser.add_argument(
+        "--max-size-mb", type=int, default=2048, help="Cache size cap in megabytes"
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=7 * 24 * 3600,
+        help="Seconds before a cached image is revalidated upstream",
+    )
+    parser.add_argument(
+        "--images", type=Path, default=Path("images"), help="Downloader output dir"
+    )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=Path("art.csv"),
+        help="Downloader input csv (objectid,thumburl) used to find local images",
+    )
+    parser.add_argument(
+        "--allow-host",
+        action="append",
+        default=["api.nga.gov"],
+        help="Upstream host that may be proxied (repeatable)",
+    )
+    parser.add_argument(
+        "--atlas-dir",
+        type=Path,
+        help="Sprite atlases from atlas.py, served under /atlas/",
+    )
+    parser.add_argument(
+        "--offline", action="store_true", help="Never contact upstream servers"
+    )
+    args = parser.parse_args()
+
+    local_files = (
+        read_local_files(args.index, args.images) if args.index.exists() else {}
+    )
+    client = (
+        None
+        if args.offline
+        else httpx.Client(
+            follow_redirects=True,
+            timeout=30,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+        )
+    )
+    proxy = ImageProxy(
+        DiskCache(args.cache_dir, args.max_size_mb * 1024 * 1024),
+        client,
+        max_age=args.max_age,
+        local_files=local_files,
+    )
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port),
+        make_handler(proxy, set(args.allow_host), args.atlas_dir),
+    )
+    print(f"Serving images on http://{args.host}:{args.port}")
+    print(f"  {len(local_files)} thumbnails indexed from {args.images}")
+    print("Set NGA_IMAGE_PROXY to this address before starting marimo.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if client is not None:
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
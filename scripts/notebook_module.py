@@ -0,0 +1,19 @@
+"""
+Import marimo notebooks as modules, to reuse their ``@app.function``s in
+scripts.
+"""
+
+import importlib.util
+import pathlib
+
+NOTEBOOKS_DIR = pathlib.Path(__file__).parent.parent / "notebooks"
+
+
+def load_notebook(name: str):
+    """Import ``notebooks/<name>.py`` as a module."""
+    path = NOTEBOOKS_DIR / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,79 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "polars",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Maintain the sorted public domain object ID index used by the notebooks.
+"""
+
+import argparse
+import pathlib
+
+import polars as pl
+
+SELF_DIR = pathlib.Path(__file__).parent
+
+
+def read_ids(path: pathlib.Path) -> pl.Series:
+    """Read newline-delimited object IDs from a text file."""
+    return (
+        pl.read_csv(path, has_header=False, new_columns=["objectid"])
+        .get_column("objectid")
+        .cast(pl.Int32)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Create or incrementally update the public domain ID index."
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=pathlib.Path,
+        default=SELF_DIR / "../notebooks/public_domain_ids.parquet",
+        help="Index parquet file (updated in place)",
+    )
+    parser.add_argument(
+        "--add",
+        type=pathlib.Path,
+        action="append",
+        default=[],
+        help="Text file of object IDs to add (one per line)",
+    )
+    parser.add_argument(
+        "--remove",
+        type=pathlib.Path,
+        action="append",
+        default=[],
+        help="Text file of object IDs to remove (one per line)",
+    )
+    args = parser.parse_args()
+
+    if args.output.exists():
+        ids = pl.read_parquet(args.output).get_column("objectid")
+    else:
+        ids = pl.Series("objectid", [], dtype=pl.Int32)
+    before = ids.len()
+
+    for path in args.add:
+        ids = ids.append(read_ids(path))
+    removed = (
+        pl.concat([read_ids(path) for path in args.remove]) if args.remove else None
+    )
+
+    ids = ids.unique().sort()
+    if removed is not None:
+        ids = ids.filter(~ids.is_in(removed.implode()))
+
+    pl.DataFrame({"objectid": ids}).write_parquet(args.output, statistics=True)
+    print(f"{before} -> {ids.len()} public domain IDs saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
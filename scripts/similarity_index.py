@@ -0,0 +1,112 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "numpy",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Prepare embeddings for similarity search in the notebooks.
+
+Writes L2-normalized vectors sorted by object ID as plain ``.npy`` files, so
+the notebook can memory-map them, and optionally an IVF index (k-means
+clusters) so queries only scan the closest clusters.
+"""
+
+import argparse
+import pathlib
+
+import numpy as np
+
+SELF_DIR = pathlib.Path(__file__).parent
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def kmeans(
+    x: np.ndarray, k: int, iterations: int, sample: int, seed: int = 42
+) -> np.ndarray:
+    """Spherical k-means centroids, trained on a random sample of ``x``."""
+    rng = np.random.default_rng(seed)
+    train = x[rng.choice(len(x), min(sample, len(x)), replace=False)]
+    centroids = train[rng.choice(len(train), k, replace=False)]
+    for i in range(iterations):
+        assignment = np.argmax(train @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, train)
+        empty = np.bincount(assignment, minlength=k) == 0
+        sums[empty] = train[rng.choice(len(train), empty.sum(), replace=False)]
+        centroids = normalize(sums)
+        print(f"  k-means iteration {i + 1}/{iterations}")
+    return centroids
+
+
+def assign(x: np.ndarray, centroids: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    return np.concatenate(
+        [
+            np.argmax(x[start : start + chunk] @ centroids.T, axis=1)
+            for start in range(0, len(x), chunk)
+        ]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build a memory-mappable similarity index from embeddings."
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=pathlib.Path,
+        default=SELF_DIR / "embeddings.npz",
+        help="Input embeddings file",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=pathlib.Path,
+        default=SELF_DIR / "similarity",
+        help="Output directory",
+    )
+    parser.add_argument(
+        "--ivf",
+        type=int,
+        default=0,
+        help="Number of IVF clusters for approximate search (0 = exact only)",
+    )
+    parser.add_argument("--iterations", type=int, default=10, help="k-means iterations")
+    parser.add_argument(
+        "--sample", type=int, default=50_000, help="k-means training sample size"
+    )
+    args = parser.parse_args()
+
+    raw = np.load(args.input)
+    order = np.argsort(raw["object_ids"], kind="stable")
+    object_ids = raw["object_ids"][order].astype(np.int32)
+    vectors = normalize(raw["embeddings"][order].astype(np.float32))
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    np.save(args.output / "vectors.npy", vectors)
+    np.save(args.output / "object_ids.npy", object_ids)
+    print(f"Saved {vectors.shape} vectors to {args.output}")
+
+    if args.ivf:
+        print(f"Training IVF index with {args.ivf} clusters")
+        centroids = kmeans(vectors, args.ivf, args.iterations, args.sample)
+        assignment = assign(vectors, centroids)
+        members = np.argsort(assignment, kind="stable").astype(np.int32)
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignment, minlength=args.ivf))]
+        ).astype(np.int64)
+        np.save(args.output / "centroids.npy", centroids.astype(np.float32))
+        np.save(args.output / "list_offsets.npy", offsets)
+        np.save(args.output / "list_members.npy", members)
+        print(f"Saved IVF index to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+//! Adaptive (AIMD) concurrency limit and jittered backoff.
+
+use std::collections::hash_map::RandomState;
+use std::hash::{BuildHasher, Hasher};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant, SystemTime};
+
+use tokio::sync::Notify;
+
+struct LimitState {
+    limit: f64,
+    in_flight: usize,
+    /// Smoothed request latency, and the lowest it has been
+    latency: Option<f64>,
+    best_latency: Option<f64>,
+    last_decrease: Instant,
+    paused_until: Option<Instant>,
+    min_seen: f64,
+    max_seen: f64,
+}
+
+/// Concurrency limit that grows by about one request per round trip while
+/// requests succeed quickly, and shrinks multiplicatively when the server
+/// throttles, requests fail, or latency climbs well above its best.
+pub struct AdaptiveLimit {
+    state: Mutex<LimitState>,
+    notify: Notify,
+    max: f64,
+}
+
+pub struct Permit {
+    limit: Arc<AdaptiveLimit>,
+}
+
+impl Drop for Permit {
+    fn drop(&mut self) {
+        self.limit.state.lock().unwrap().in_flight -= 1;
+        self.limit.notify.notify_one();
+    }
+}
+
+impl AdaptiveLimit {
+    pub fn new(initial: usize, max: usize) -> Self {
+        let initial = initial.clamp(1, max.max(1)) as f64;
+        Self {
+            state: Mutex::new(LimitState {
+                limit: initial,
+                in_flight: 0,
+                latency: None,
+                best_latency: None,
+                last_decrease: Instant::now()
+                    .checked_sub(Duration::from_secs(3600))
+                    .unwrap_or_else(Instant::now),
+                paused_until: None,
+                min_seen: initial,
+                max_seen: initial,
+            }),
+            notify: Notify::new(),
+            max: max.max(1) as f64,
+        }
+    }
+
+    /// Wait for a free slot under the current limit (and any server-requested pause).
+    pub async fn acquire(self: &Arc<Self>) -> Permit {
+        loop {
+            let notified = self.notify.notified();
+            let pause = {
+                let mut state = self.state.lock().unwrap();
+                let pause = state.paused_until.filter(|until| *until > Instant::now());
+                if pause.is_none() && (state.in_flight as f64) < state.limit.floor() {
+                    state.in_flight += 1;
+                    return Permit {
+                        limit: Arc::clone(self),
+                    };
+                }
+                pause
+            };
+            match pause {
+                Some(until) => tokio::time::sleep_until(until.into()).await,
+                None => notified.await,
+            }
+        }
+    }
+
+    pub fn on_success(&self, latency: Duration) {
+        let mut state = self.state.lock().unwrap();
+        let latency = latency.as_secs_f64();
+        let smoothed = match state.latency {
+            Some(previous) => 0.8 * previous + 0.2 * latency,
+            None => latency,
+        };
+        state.latency = Some(smoothed);
+        let best = state
+            .best_latency
+            .map_or(smoothed, |best| best.min(smoothed));
+        state.best_latency = Some(best);
+
+        if smoothed > 2.0 * best + 0.05 {
+            self.decrease(&mut state, 0.9);
+        } else {
+            let before = state.limit.floor();
+            state.limit = (state.limit + 1.0 / state.limit).min(self.max);
+            state.max_seen = state.max_seen.max(state.limit);
+            if state.limit.floor() > before {
+                drop(state);
+                self.notify.notify_one();
+            }
+        }
+    }
+
+    /// The server asked us to slow down (429/503), optionally for `retry_after`.
+    pub fn on_throttle(&self, retry_after: Option<Duration>) {
+        let mut state = self.state.lock().unwrap();
+        self.decrease(&mut state, 0.5);
+        if let Some(delay) = retry_after {
+            let until = Instant::now() + delay;
+            state.paused_until = Some(state.paused_until.map_or(until, |u| u.max(until)));
+        }
+    }
+
+    pub fn on_error(&self) {
+        let mut state = self.state.lock().unwrap();
+        self.decrease(&mut state, 0.7);
+    }
+
+    /// Multiplicative decrease, at most once per smoothed round trip so one
+    /// burst of failures does not collapse the limit.
+    fn decrease(&self, state: &mut LimitState, factor: f64) {
+        let cooldown = Duration::from_secs_f64(state.latency.unwrap_or(1.0).max(0.1));
+        if state.last_decrease.elapsed() < cooldown {
+            return;
+        }
+        state.limit = (state.limit * factor).max(1.0);
+        state.min_seen = state.min_seen.min(state.limit);
+        state.last_decrease = Instant::now();
+    }
+
+    pub fn current(&self) -> usize {
+        self.state.lock().unwrap().limit.floor() as usize
+    }
+
+    /// Lowest and highest limit reached so far.
+    pub fn range(&self) -> (usize, usize) {
+        let state = self.state.lock().unwrap();
+        (
+            state.min_seen.floor() as usize,
+            state.max_seen.floor() as usize,
+        )
+    }
+}
+
+/// Full-jitter exponential backoff: a random delay up to `base * 2^attempt`,
+/// capped at `cap`.
+pub fn backoff(attempt: u32, base: Duration, cap: Duration) -> Duration {
+    let ceiling = base.saturating_mul(1 << attempt.min(16)).min(cap);
+    let mut hasher = RandomState::new().build_hasher();
+    hasher.write_u32(attempt);
+    let fraction = (hasher.finish() >> 11) as f64 / (1u64 << 53) as f64;
+    ceiling.mul_f64(fraction)
+}
+
+/// Parse a `Retry-After` header, given either in seconds or as an HTTP
+/// date (a date in the past means no wait).
+pub fn retry_after(headers: &reqwest::header::HeaderMap) -> Option<Duration> {
+    let value = headers
+        .get(reqwest::header::RETRY_AFTER)?
+        .to_str()
+        .ok()?
+        .trim();
+    if let Ok(seconds) = value.parse::<u64>() {
+        return Some(Duration::from_secs(seconds));
+    }
+    let date = httpdate::parse_http_date(value).ok()?;
+    Some(
+        date.duration_since(SystemTime::now())
+            .unwrap_or(Duration::ZERO),
+    )
+}
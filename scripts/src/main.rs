@@ -1,17 +1,53 @@
-use std::fs::File;
-use std::io::BufReader;
+mod limit;
+mod manifest;
+mod metrics;
+mod shards;
+mod transform;
+
+use std::collections::{HashMap, HashSet};
+use std::io::{LineWriter, Write};
 use std::num::NonZeroU32;
-use std::path::PathBuf;
-use std::sync::atomic::{AtomicUsize, Ordering};
-use std::sync::Arc;
-use std::time::Duration;
+use std::path::{Path, PathBuf};
+use std::sync::atomic::{AtomicBool, AtomicUsize, Ordering};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
 
 use anyhow::{Context, Result};
 use clap::Parser;
 use futures::stream::{self, StreamExt};
-use governor::{Quota, RateLimiter};
+use governor::{DefaultDirectRateLimiter, Quota, RateLimiter};
 use indicatif::{ProgressBar, ProgressStyle};
-use tokio::sync::Semaphore;
+use reqwest::header::{HeaderMap, ETAG, IF_MODIFIED_SINCE, IF_NONE_MATCH, LAST_MODIFIED};
+use reqwest::StatusCode;
+use sha2::{Digest, Sha256};
+use tokio::io::AsyncWriteExt;
+
+use limit::AdaptiveLimit;
+use manifest::ManifestEntry;
+use metrics::{Failure, Metrics};
+use shards::ShardWriter;
+use transform::{StoreFormat, Transform};
+
+/// How often the manifest and changed IDs are saved during a run, so a
+/// killed run keeps what it downloaded
+const CHECKPOINT_INTERVAL: Duration = Duration::from_secs(30);
+
+/// Lines `--emit` may queue ahead of a slow reader before downloads wait
+const EMIT_BUFFER: usize = 1024;
+
+/// Set when `--emit -` claims stdout for the stream of completed downloads.
+static STDOUT_TAKEN: AtomicBool = AtomicBool::new(false);
+
+/// `println!` that moves to stderr while stdout carries `--emit` output.
+macro_rules! status {
+    ($($arg:tt)*) => {
+        if STDOUT_TAKEN.load(Ordering::Relaxed) {
+            eprintln!($($arg)*)
+        } else {
+            println!($($arg)*)
+        }
+    };
+}
 
 #[derive(Debug, serde::Deserialize)]
 struct DownloadRecord {
@@ -37,73 +73,195 @@ struct Args {
     #[arg(short, long, default_value = "50")]
     concurrency: usize,
 
+    /// Concurrent downloads to start with; adjusted up to --concurrency
+    /// based on latency, errors and throttling
+    #[arg(long, default_value = "8")]
+    initial_concurrency: usize,
+
     /// Maximum requests per second
     #[arg(short, long, default_value = "500")]
     rate_limit: u32,
 
-    /// Number of retry attempts on failure
+    /// Number of retry attempts on failure (failures get one more pass at the end)
     #[arg(long, default_value = "3")]
     retries: u32,
+
+    /// Revalidate existing images with conditional requests and record
+    /// IDs that disappeared from the CSV (only when the CSV is the full
+    /// list, not one filtered by download_list.py)
+    #[arg(long)]
+    sync: bool,
+
+    /// Download manifest [default: <output>/manifest.csv]
+    #[arg(long)]
+    manifest: Option<PathBuf>,
+
+    /// Where to write the IDs of new or changed images
+    #[arg(long, default_value = "changed_ids.txt")]
+    changed: PathBuf,
+
+    /// Where to write the IDs removed from the CSV (with --sync)
+    #[arg(long, default_value = "removed_ids.txt")]
+    removed: PathBuf,
+
+    /// Pack images into tar shards of about this many MB, indexed by
+    /// <output>/index.csv, instead of writing one file per image
+    #[arg(long)]
+    shard_size: Option<u64>,
+
+    /// Resize the shorter side to this many pixels while downloading, as
+    /// the embedding model's processor does (256 for DINOv2)
+    #[arg(long)]
+    resize: Option<u32>,
+
+    /// Center-crop resized images to a square of this many pixels, the
+    /// processor's crop size (224 for DINOv2) [default: --resize]
+    #[arg(long, requires = "resize")]
+    crop: Option<u32>,
+
+    /// How to store resized images
+    #[arg(long, value_enum, default_value = "jpeg", requires = "resize")]
+    store_format: StoreFormat,
+
+    /// JPEG quality for resized images
+    #[arg(long, default_value = "90")]
+    jpeg_quality: u8,
+
+    /// Write "<id>\t<path>\t<sha256>" for every new or changed image as soon
+    /// as it is stored, to this file or FIFO ("-" for stdout), e.g. for
+    /// `embed.py --stream`
+    #[arg(long, conflicts_with = "shard_size")]
+    emit: Option<PathBuf>,
+
+    /// Where to write the JSON run report (latency and size histograms,
+    /// status codes, throughput, failed IDs with reasons)
+    #[arg(long, default_value = "download_report.json")]
+    report: PathBuf,
 }
 
-fn read_csv(path: &PathBuf) -> Result<Vec<DownloadRecord>> {
-    let mut reader = File::open(path)
-        .map(BufReader::new)
-        .map(csv::Reader::from_reader)?;
+/// Temporary path a download is streamed to before it is renamed into place.
+pub(crate) fn part_path(output_path: &Path) -> PathBuf {
+    let mut path = output_path.as_os_str().to_owned();
+    path.push(".part");
+    PathBuf::from(path)
+}
 
-    let mut records = Vec::new();
-    for result in reader.deserialize() {
-        records.push(result?);
+/// Stream the response body to `<output>.part`, verify it against
+/// Content-Length, then atomically rename it to `output_path`.
+///
+/// A killed run can only leave `.part` files behind, so an existing
+/// `output_path` is always a complete download. Returns the size and the
+/// hex SHA-256 of the body.
+async fn write_atomically(
+    mut response: reqwest::Response,
+    output_path: &Path,
+) -> Result<(u64, String)> {
+    let expected = response.content_length();
+    let part = part_path(output_path);
+    let mut file = tokio::fs::File::create(&part).await?;
+    let mut written = 0u64;
+    let mut hasher = Sha256::new();
+
+    let result: Result<()> = async {
+        while let Some(chunk) = response.chunk().await? {
+            file.write_all(&chunk).await?;
+            hasher.update(&chunk);
+            written += chunk.len() as u64;
+        }
+        file.flush().await?;
+        file.sync_data().await?;
+        if let Some(expected) = expected {
+            anyhow::ensure!(
+                written == expected,
+                "Truncated body: got {} of {} bytes",
+                written,
+                expected
+            );
+        }
+        Ok(())
     }
+    .await;
+    drop(file);
 
-    Ok(records)
+    match result {
+        Ok(()) => {
+            tokio::fs::rename(&part, output_path).await?;
+            Ok((written, format!("{:x}", hasher.finalize())))
+        }
+        Err(e) => {
+            let _ = tokio::fs::remove_file(&part).await;
+            Err(e)
+        }
+    }
 }
 
-async fn download_with_retry(
-    client: &reqwest::Client,
-    url: &url::Url,
-    output_path: &PathBuf,
-    retries: u32,
-) -> Result<()> {
-    let mut last_error = None;
-
-    for attempt in 0..=retries {
-        if attempt > 0 {
-            // Exponential backoff: 1s, 2s, 4s, ...
-            let delay = Duration::from_secs(1 << (attempt - 1));
-            tokio::time::sleep(delay).await;
-        }
-
-        match client.get(url.clone()).send().await {
-            Ok(response) => {
-                if response.status().is_success() {
-                    match response.bytes().await {
-                        Ok(bytes) => {
-                            tokio::fs::write(output_path, &bytes).await?;
-                            return Ok(());
-                        }
-                        Err(e) => {
-                            last_error =
-                                Some(anyhow::anyhow!("Failed to read response body: {}", e));
-                        }
-                    }
-                } else {
-                    last_error = Some(anyhow::anyhow!("HTTP {}: {}", response.status(), url));
-                }
-            }
-            Err(e) => {
-                last_error = Some(anyhow::anyhow!("Request failed: {}", e));
-            }
+/// Read the whole response body, check it against Content-Length, and
+/// return it with its hex SHA-256.
+async fn read_body(response: reqwest::Response) -> Result<(Vec<u8>, String)> {
+    let expected = response.content_length();
+    let body = Vec::from(response.bytes().await?);
+    if let Some(expected) = expected {
+        anyhow::ensure!(
+            body.len() as u64 == expected,
+            "Truncated body: got {} of {} bytes",
+            body.len(),
+            expected
+        );
+    }
+    let sha256 = format!("{:x}", Sha256::digest(&body));
+    Ok((body, sha256))
+}
+
+/// Write `data` to `<output>.part`, then atomically rename it to `output_path`.
+async fn write_bytes_atomically(data: &[u8], output_path: &Path) -> Result<()> {
+    let part = part_path(output_path);
+    let mut file = tokio::fs::File::create(&part).await?;
+    file.write_all(data).await?;
+    file.sync_data().await?;
+    drop(file);
+    tokio::fs::rename(&part, output_path).await?;
+    Ok(())
+}
+
+/// Remove `.part` files left behind by an interrupted run.
+fn remove_partial_downloads(dir: &Path) -> Result<usize> {
+    let mut removed = 0;
+    for entry in std::fs::read_dir(dir)? {
+        let path = entry?.path();
+        if path.extension().is_some_and(|ext| ext == "part") {
+            std::fs::remove_file(&path)?;
+            removed += 1;
         }
     }
+    Ok(removed)
+}
+
+async fn file_sha256(path: &Path) -> Result<String> {
+    let bytes = tokio::fs::read(path).await?;
+    Ok(format!("{:x}", Sha256::digest(&bytes)))
+}
 
-    Err(last_error.unwrap_or_else(|| anyhow::anyhow!("Unknown error")))
+fn header(headers: &HeaderMap, name: reqwest::header::HeaderName) -> Option<String> {
+    headers
+        .get(name)
+        .and_then(|value| value.to_str().ok())
+        .map(str::to_owned)
+}
+
+enum Outcome {
+    Fetched(ManifestEntry),
+    NotModified,
+    /// A client error that retrying will not fix (e.g. 404)
+    Rejected(StatusCode),
 }
 
 struct DownloadState {
     success: AtomicUsize,
     failed: AtomicUsize,
     skipped: AtomicUsize,
+    unchanged: AtomicUsize,
+    retries: AtomicUsize,
+    throttled: AtomicUsize,
 }
 
 impl DownloadState {
@@ -112,6 +270,9 @@ impl DownloadState {
             success: AtomicUsize::new(0),
             failed: AtomicUsize::new(0),
             skipped: AtomicUsize::new(0),
+            unchanged: AtomicUsize::new(0),
+            retries: AtomicUsize::new(0),
+            throttled: AtomicUsize::new(0),
         }
     }
 
@@ -127,6 +288,18 @@ impl DownloadState {
         self.skipped.fetch_add(1, Ordering::Relaxed);
     }
 
+    fn increment_unchanged(&self) {
+        self.unchanged.fetch_add(1, Ordering::Relaxed);
+    }
+
+    fn increment_retries(&self) {
+        self.retries.fetch_add(1, Ordering::Relaxed);
+    }
+
+    fn increment_throttled(&self) {
+        self.throttled.fetch_add(1, Ordering::Relaxed);
+    }
+
     fn success(&self) -> usize {
         self.success.load(Ordering::Relaxed)
     }
@@ -138,95 +311,574 @@ impl DownloadState {
     fn skipped(&self) -> usize {
         self.skipped.load(Ordering::Relaxed)
     }
+
+    fn unchanged(&self) -> usize {
+        self.unchanged.load(Ordering::Relaxed)
+    }
+
+    fn retries(&self) -> usize {
+        self.retries.load(Ordering::Relaxed)
+    }
+
+    fn throttled(&self) -> usize {
+        self.throttled.load(Ordering::Relaxed)
+    }
+}
+
+/// Everything shared by the concurrent downloads of one run.
+struct Downloader {
+    client: reqwest::Client,
+    rate_limiter: DefaultDirectRateLimiter,
+    limit: Arc<AdaptiveLimit>,
+    state: DownloadState,
+    metrics: Metrics,
+    manifest: Mutex<HashMap<i32, ManifestEntry>>,
+    changed: Mutex<Vec<i32>>,
+    /// Set when the manifest or changed IDs differ from what is on disk
+    dirty: AtomicBool,
+    manifest_path: PathBuf,
+    changed_path: PathBuf,
+    /// Records to try once more after the main pass
+    deferred: Mutex<Vec<DownloadRecord>>,
+    progress: ProgressBar,
+    output: PathBuf,
+    /// Set when packing into shards instead of writing loose files
+    shards: Option<Arc<ShardWriter>>,
+    /// Set when resizing images as they are downloaded
+    transform: Option<Transform>,
+    /// Extension of stored images (`jpg`, or `rgb` for raw pixels)
+    extension: &'static str,
+    /// Queue of `--emit` lines for the writer thread
+    emit: Option<tokio::sync::mpsc::Sender<String>>,
+    retries: u32,
+    sync: bool,
+}
+
+impl Downloader {
+    /// Store a successful response, resizing it and/or packing it into a
+    /// shard when configured. Plain downloads are streamed straight to
+    /// disk. Returns the size and hex SHA-256 of the original body, so
+    /// revalidation compares against what the server sent.
+    async fn store(
+        &self,
+        id: i32,
+        response: reqwest::Response,
+        output_path: &Path,
+    ) -> Result<(u64, String)> {
+        if self.transform.is_none() && self.shards.is_none() {
+            return write_atomically(response, output_path).await;
+        }
+
+        let (body, sha256) = read_body(response).await?;
+        let size = body.len() as u64;
+        let data = match self.transform {
+            // decode and resize on the blocking pool, in parallel with the network I/O
+            Some(transform) => {
+                tokio::task::spawn_blocking(move || transform.apply(&body)).await??
+            }
+            None => body,
+        };
+        match &self.shards {
+            Some(shards) => shards.store(id, data).await?,
+            None => write_bytes_atomically(&data, output_path).await?,
+        }
+        Ok((size, sha256))
+    }
+
+    /// Download `record`, revalidating against `previous` when given.
+    ///
+    /// Each attempt waits for a slot under the adaptive concurrency limit
+    /// and the rate limiter. Throttling (429/503) honors `Retry-After`,
+    /// and retries back off exponentially with full jitter.
+    async fn download_with_retry(
+        &self,
+        record: &DownloadRecord,
+        output_path: &Path,
+        previous: Option<&ManifestEntry>,
+    ) -> Result<Outcome> {
+        let url = &record.url;
+        let mut last_error = None;
+
+        for attempt in 0..=self.retries {
+            if attempt > 0 {
+                self.state.increment_retries();
+                let delay = limit::backoff(
+                    attempt - 1,
+                    Duration::from_millis(500),
+                    Duration::from_secs(30),
+                );
+                tokio::time::sleep(delay).await;
+            }
+
+            let _permit = self.limit.acquire().await;
+            self.rate_limiter.until_ready().await;
+
+            let mut request = self.client.get(url.clone());
+            if let Some(previous) = previous {
+                if let Some(etag) = &previous.etag {
+                    request = request.header(IF_NONE_MATCH, etag);
+                }
+                if let Some(last_modified) = &previous.last_modified {
+                    request = request.header(IF_MODIFIED_SINCE, last_modified);
+                }
+            }
+
+            let start = Instant::now();
+            match request.send().await {
+                Ok(response) => {
+                    // time to headers: the server's share, before the body,
+                    // disk writes and resizing
+                    let latency = start.elapsed();
+                    let status = response.status();
+                    self.metrics.record_response(status.as_u16(), latency);
+                    if previous.is_some() && status == StatusCode::NOT_MODIFIED {
+                        self.limit.on_success(latency);
+                        return Ok(Outcome::NotModified);
+                    }
+                    if status.is_success() {
+                        let etag = header(response.headers(), ETAG);
+                        let last_modified = header(response.headers(), LAST_MODIFIED);
+                        match self.store(record.id, response, output_path).await {
+                            Ok((size, sha256)) => {
+                                self.limit.on_success(latency);
+                                return Ok(Outcome::Fetched(ManifestEntry {
+                                    id: record.id,
+                                    url: url.to_string(),
+                                    etag,
+                                    last_modified,
+                                    size,
+                                    sha256,
+                                    fetched_at: manifest::now(),
+                                }));
+                            }
+                            Err(e) => {
+                                self.limit.on_error();
+                                last_error = Some(e.context("Failed to write response body"));
+                            }
+                        }
+                    } else if status == StatusCode::TOO_MANY_REQUESTS
+                        || status == StatusCode::SERVICE_UNAVAILABLE
+                    {
+                        self.state.increment_throttled();
+                        self.limit
+                            .on_throttle(limit::retry_after(response.headers()));
+                        last_error = Some(anyhow::anyhow!("HTTP {}: {}", status, url));
+                    } else if status.is_server_error() || status == StatusCode::REQUEST_TIMEOUT {
+                        self.limit.on_error();
+                        last_error = Some(anyhow::anyhow!("HTTP {}: {}", status, url));
+                    } else {
+                        self.limit.on_success(latency);
+                        return Ok(Outcome::Rejected(status));
+                    }
+                }
+                Err(e) => {
+                    self.limit.on_error();
+                    self.metrics.record_error(&e);
+                    last_error = Some(anyhow::anyhow!("Request failed: {}", e));
+                }
+            }
+        }
+
+        Err(last_error.unwrap_or_else(|| anyhow::anyhow!("Unknown error")))
+    }
+
+    /// Queue an `--emit` line. A full queue (the reader fell behind) makes
+    /// this download wait here, after its request slot was released, so
+    /// backpressure never stalls the runtime or in-flight requests.
+    async fn emit(&self, id: i32, path: &Path, sha256: &str) {
+        if let Some(emit) = &self.emit {
+            let line = format!("{}\t{}\t{}", id, path.display(), sha256);
+            if emit.send(line).await.is_err() {
+                self.progress
+                    .println(format!("Failed to emit {}: the output was closed", id));
+            }
+        }
+    }
+
+    /// Save the manifest and changed IDs if anything changed since the last
+    /// save. Both files are replaced atomically, off the async runtime.
+    async fn checkpoint(&self) -> Result<()> {
+        if !self.dirty.swap(false, Ordering::Relaxed) {
+            return Ok(());
+        }
+        let manifest = self.manifest.lock().unwrap().clone();
+        let changed = self.changed.lock().unwrap().clone();
+        let manifest_path = self.manifest_path.clone();
+        let changed_path = self.changed_path.clone();
+        tokio::task::spawn_blocking(move || {
+            manifest::write_manifest(&manifest_path, &manifest)?;
+            manifest::write_ids(&changed_path, &changed)
+        })
+        .await?
+    }
+
+    /// Download one record and record the outcome. On the main pass,
+    /// records that exhausted their retries are deferred to a final pass.
+    async fn process(&self, record: DownloadRecord, final_pass: bool) {
+        let output_path = self
+            .output
+            .join(format!("{}.{}", record.id, self.extension));
+        let exists = match &self.shards {
+            Some(shards) => shards.contains(record.id),
+            None => output_path.exists(),
+        };
+
+        // Skip if file already exists (resume support)
+        if exists && !self.sync {
+            self.state.increment_skipped();
+            self.progress.inc(1);
+            return;
+        }
+
+        // Revalidate only if the file is there and the URL is unchanged
+        let previous = self.manifest.lock().unwrap().get(&record.id).cloned();
+        let validators = previous
+            .as_ref()
+            .filter(|entry| exists && entry.url == record.url.as_str());
+        let previous_hash = match (&previous, exists) {
+            (Some(entry), true) => Some(entry.sha256.clone()),
+            // downloaded before the manifest existed
+            (None, true) if self.shards.is_none() && self.transform.is_none() => {
+                file_sha256(&output_path).await.ok()
+            }
+            (None, true) => None,
+            (_, false) => None,
+        };
+
+        let failure = match self
+            .download_with_retry(&record, &output_path, validators)
+            .await
+        {
+            Ok(Outcome::NotModified) => {
+                if let Some(entry) = self.manifest.lock().unwrap().get_mut(&record.id) {
+                    entry.fetched_at = manifest::now();
+                    self.dirty.store(true, Ordering::Relaxed);
+                }
+                self.state.increment_unchanged();
+                self.metrics.record_completion(None);
+                None
+            }
+            Ok(Outcome::Fetched(entry)) => {
+                if previous_hash.as_deref() == Some(entry.sha256.as_str()) {
+                    self.state.increment_unchanged();
+                } else {
+                    self.changed.lock().unwrap().push(record.id);
+                    self.state.increment_success();
+                    self.emit(record.id, &output_path, &entry.sha256).await;
+                }
+                self.metrics.record_completion(Some(entry.size));
+                self.manifest.lock().unwrap().insert(record.id, entry);
+                self.dirty.store(true, Ordering::Relaxed);
+                None
+            }
+            Ok(Outcome::Rejected(status)) => Some(format!("HTTP {}", status)),
+            Err(_) if !final_pass => {
+                self.deferred.lock().unwrap().push(record);
+                return;
+            }
+            Err(e) => Some(format!("{:#}", e)),
+        };
+
+        if let Some(reason) = failure {
+            self.state.increment_failed();
+            self.metrics.record_completion(None);
+            self.progress
+                .println(format!("Failed {}: {}", record.url, reason));
+            self.metrics.record_failure(Failure {
+                id: record.id,
+                url: record.url.to_string(),
+                reason,
+            });
+        }
+
+        self.progress.inc(1);
+        self.progress
+            .set_message(format!("concurrency {}", self.limit.current()));
+    }
 }
 
 #[tokio::main]
 async fn main() -> Result<()> {
     let args = Args::parse();
 
+    let emit: Option<Box<dyn Write + Send>> = match args.emit.as_deref() {
+        Some(path) if path == Path::new("-") => {
+            STDOUT_TAKEN.store(true, Ordering::Relaxed);
+            Some(Box::new(LineWriter::new(std::io::stdout())))
+        }
+        Some(path) => Some(Box::new(LineWriter::new(
+            std::fs::OpenOptions::new()
+                .create(true)
+                .append(true)
+                .open(path)
+                .context("Failed to open --emit output")?,
+        ))),
+        None => None,
+    };
+    // Blocking writes happen on one dedicated thread, fed through a bounded channel
+    let (emit, emit_writer) = match emit {
+        Some(mut output) => {
+            let (sender, mut receiver) = tokio::sync::mpsc::channel::<String>(EMIT_BUFFER);
+            let writer = tokio::task::spawn_blocking(move || -> std::io::Result<()> {
+                while let Some(line) = receiver.blocking_recv() {
+                    writeln!(output, "{}", line)?;
+                }
+                output.flush()
+            });
+            (Some(sender), Some(writer))
+        }
+        None => (None, None),
+    };
+
     // Create output directory
     tokio::fs::create_dir_all(&args.output)
         .await
         .context("Failed to create output directory")?;
+    let removed = remove_partial_downloads(&args.output)?;
+    if removed > 0 {
+        status!("Removed {} partial downloads from an earlier run", removed);
+    }
+
+    let transform = args.resize.map(|resize| Transform {
+        resize,
+        crop: args.crop.unwrap_or(resize),
+        format: args.store_format,
+        quality: args.jpeg_quality,
+    });
+    if let Some(transform) = &transform {
+        anyhow::ensure!(
+            transform.crop <= transform.resize,
+            "--crop ({}) must not exceed --resize ({})",
+            transform.crop,
+            transform.resize
+        );
+    }
+    let extension = match transform {
+        Some(transform) => transform.format.extension(),
+        None => "jpg",
+    };
+    if let Some(transform) = &transform {
+        // tells embed.py the images are already at the model resolution
+        std::fs::write(args.output.join("preprocess.json"), transform.describe())?;
+    }
 
-    // Read CSV file
-    println!("Reading CSV file: {:?}", args.input);
-    let records = read_csv(&args.input)?;
-    println!("Found {} records with valid URLs", records.len());
+    let shards = match args.shard_size {
+        Some(mb) => Some(Arc::new(ShardWriter::open(
+            &args.output,
+            mb << 20,
+            extension,
+        )?)),
+        None => None,
+    };
+
+    let manifest_path = args
+        .manifest
+        .clone()
+        .unwrap_or_else(|| args.output.join("manifest.csv"));
+    let manifest = manifest::read_manifest(&manifest_path)?;
+    status!(
+        "Loaded {} manifest entries from {:?}",
+        manifest.len(),
+        manifest_path
+    );
+
+    let list_info = manifest::read_list_info(&args.input)?;
+
+    // Stream records from the CSV instead of loading them all up front
+    status!("Reading CSV file: {:?}", args.input);
+    let mut seen = HashSet::new();
+    let records = csv::Reader::from_path(&args.input)
+        .context("Failed to open CSV file")?
+        .into_deserialize::<DownloadRecord>()
+        .filter_map(|result| match result {
+            Ok(record) => Some(record),
+            Err(e) => {
+                eprintln!("Skipping invalid row: {}", e);
+                None
+            }
+        })
+        .inspect(|record| {
+            seen.insert(record.id);
+        });
 
     // Set up rate limiter
-    let rate_limiter = Arc::new(RateLimiter::direct(Quota::per_second(
+    let rate_limiter = RateLimiter::direct(Quota::per_second(
         NonZeroU32::new(args.rate_limit).context("Rate limit must be > 0")?,
-    )));
-
-    // Set up concurrency limiter
-    let semaphore = Arc::new(Semaphore::new(args.concurrency));
+    ));
 
     // Set up HTTP client
     let client = reqwest::Client::builder()
         .timeout(Duration::from_secs(30))
         .build()?;
 
-    // Progress tracking
-    let progress = ProgressBar::new(records.len() as u64);
+    // Progress tracking (the record count is not known up front)
+    let progress = ProgressBar::no_length();
     progress.set_style(
-        ProgressStyle::default_bar()
-            .template("{spinner:.green} [{elapsed_precise}] [{bar:40.cyan/blue}] {pos}/{len} ({eta}) {msg}")?
-            .progress_chars("#>-"),
+        ProgressStyle::default_spinner()
+            .template("{spinner:.green} [{elapsed_precise}] {pos} records ({per_sec}) {msg}")?,
     );
 
-    let state = Arc::new(DownloadState::new());
-
-    // Process downloads in parallel
-    stream::iter(records)
-        .for_each_concurrent(args.concurrency, |record| {
-            let client = client.clone();
-            let state = Arc::clone(&state);
-            let rate_limiter = Arc::clone(&rate_limiter);
-            let semaphore = Arc::clone(&semaphore);
-            let progress = progress.clone();
-            let output_dir = args.output.clone();
-            let retries = args.retries;
-
-            async move {
-                let output_path = output_dir.join(format!("{}.jpg", record.id));
-
-                // Skip if file already exists (resume support)
-                if output_path.exists() {
-                    state.increment_skipped();
-                    progress.inc(1);
-                    return;
-                }
-
-                // Acquire semaphore permit
-                let _permit = semaphore.acquire().await.unwrap();
-
-                // Wait for rate limiter
-                rate_limiter.until_ready().await;
-
-                // Download with retry
-                match download_with_retry(&client, &record.url, &output_path, retries).await {
-                    Ok(_) => state.increment_success(),
-                    Err(e) => {
-                        state.increment_failed();
-                        progress.println(format!("Failed {}: {}", record.url, e));
-                    }
-                }
-
-                progress.inc(1);
+    let mut downloader = Downloader {
+        client,
+        rate_limiter,
+        limit: Arc::new(AdaptiveLimit::new(
+            args.initial_concurrency,
+            args.concurrency,
+        )),
+        state: DownloadState::new(),
+        metrics: Metrics::new(),
+        manifest: Mutex::new(manifest),
+        changed: Mutex::new(Vec::new()),
+        dirty: AtomicBool::new(false),
+        manifest_path: manifest_path.clone(),
+        changed_path: args.changed.clone(),
+        deferred: Mutex::new(Vec::new()),
+        progress: progress.clone(),
+        output: args.output.clone(),
+        shards,
+        transform,
+        extension,
+        emit,
+        retries: args.retries,
+        sync: args.sync,
+    };
+
+    let finished = tokio::sync::Notify::new();
+    let downloads = async {
+        // Process downloads in parallel; the adaptive limit decides how many
+        // requests are actually in flight
+        stream::iter(records)
+            .for_each_concurrent(args.concurrency, |record| downloader.process(record, false))
+            .await;
+
+        // One more pass for records that failed every retry
+        let deferred = std::mem::take(&mut *downloader.deferred.lock().unwrap());
+        if !deferred.is_empty() {
+            progress.println(format!("Retrying {} failed downloads", deferred.len()));
+            stream::iter(deferred)
+                .for_each_concurrent(args.concurrency, |record| downloader.process(record, true))
+                .await;
+        }
+        finished.notify_one();
+    };
+    // Save progress periodically; a save in flight completes before the
+    // final write below
+    let checkpoints = async {
+        let mut interval = tokio::time::interval(CHECKPOINT_INTERVAL);
+        interval.tick().await;
+        loop {
+            tokio::select! {
+                _ = interval.tick() => {}
+                _ = finished.notified() => break,
             }
-        })
-        .await;
+            if let Err(e) = downloader.checkpoint().await {
+                progress.println(format!("Failed to save the manifest: {:#}", e));
+            }
+        }
+    };
+    tokio::join!(downloads, checkpoints);
+
+    // Closing the channel lets the writer drain what is queued and exit
+    drop(downloader.emit.take());
+    if let Some(writer) = emit_writer {
+        if let Err(e) = writer.await? {
+            status!("Failed to write --emit output: {}", e);
+        }
+    }
 
     progress.finish_with_message("Done!");
+    if let Some(shards) = &downloader.shards {
+        shards.finish().context("Failed to close the last shard")?;
+        status!(
+            "Shard index written to {:?}",
+            shards.dir().join("index.csv")
+        );
+    }
 
-    println!("\nSummary:");
-    println!("  Downloaded: {}", state.success());
-    println!("  Skipped (already exists): {}", state.skipped());
-    println!("  Failed: {}", state.failed());
+    let state = &downloader.state;
+    let mut manifest = downloader.manifest.lock().unwrap();
+    // A filtered list says nothing about the IDs it left out
+    let complete_list = match &list_info {
+        Some(info) if !info.complete => {
+            if args.sync {
+                status!(
+                    "Input is a filtered list ({}); not recording removed IDs",
+                    info.filters.join(" ")
+                );
+            }
+            false
+        }
+        _ => true,
+    };
+    let removed: Vec<i32> = if args.sync && complete_list {
+        manifest
+            .keys()
+            .filter(|id| !seen.contains(*id))
+            .copied()
+            .collect()
+    } else {
+        Vec::new()
+    };
+    if args.sync {
+        for id in &removed {
+            manifest.remove(id);
+        }
+        manifest::write_ids(&args.removed, &removed)?;
+    }
+    manifest::write_manifest(&manifest_path, &manifest)?;
+    let changed = downloader.changed.lock().unwrap();
+    manifest::write_ids(&args.changed, &changed)?;
+
+    let (min_limit, max_limit) = downloader.limit.range();
+    let summary = serde_json::json!({
+        "settings": {
+            "concurrency": args.concurrency,
+            "initial_concurrency": args.initial_concurrency,
+            "rate_limit": args.rate_limit,
+            "retries": args.retries,
+            "sync": args.sync,
+        },
+        "counts": {
+            "downloaded": state.success(),
+            "unchanged": state.unchanged(),
+            "skipped": state.skipped(),
+            "failed": state.failed(),
+            "removed": removed.len(),
+            "retries": state.retries(),
+            "throttled": state.throttled(),
+        },
+        "concurrency": {
+            "final": downloader.limit.current(),
+            "min": min_limit,
+            "max": max_limit,
+        },
+    });
+    downloader
+        .metrics
+        .write_report(&args.report, summary)
+        .context("Failed to write the run report")?;
+
+    status!("\nSummary:");
+    status!("  Downloaded (new or changed): {}", state.success());
+    status!("  Unchanged: {}", state.unchanged());
+    status!("  Skipped (already exists): {}", state.skipped());
+    status!("  Failed: {}", state.failed());
+    if args.sync {
+        status!("  Removed from CSV: {}", removed.len());
+    }
+    status!("  Retries: {}", state.retries());
+    status!("  Throttled responses (429/503): {}", state.throttled());
+    status!(
+        "  Concurrency: {} at exit (range {}-{})",
+        downloader.limit.current(),
+        min_limit,
+        max_limit
+    );
+    status!("Changed IDs written to {:?}", args.changed);
+    status!("Report written to {:?}", args.report);
 
     if state.failed() > 0 {
-        println!("\nNote: {} downloads failed. Run again to retry.", state.failed());
+        status!("\nNote: {} downloads failed. Run again to retry.", state.failed());
     }
 
     Ok(())
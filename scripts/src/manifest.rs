@@ -0,0 +1,88 @@
+//! Record of what has been downloaded, used for incremental syncs.
+
+use std::collections::HashMap;
+use std::path::Path;
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use anyhow::Result;
+
+use crate::part_path;
+
+#[derive(Debug, Clone, serde::Serialize, serde::Deserialize)]
+pub struct ManifestEntry {
+    pub id: i32,
+    pub url: String,
+    pub etag: Option<String>,
+    pub last_modified: Option<String>,
+    pub size: u64,
+    pub sha256: String,
+    /// Unix timestamp (seconds) of the last fetch or revalidation
+    pub fetched_at: u64,
+}
+
+pub fn now() -> u64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map(|d| d.as_secs())
+        .unwrap_or(0)
+}
+
+pub fn read_manifest(path: &Path) -> Result<HashMap<i32, ManifestEntry>> {
+    if !path.exists() {
+        return Ok(HashMap::new());
+    }
+    let mut reader = csv::Reader::from_path(path)?;
+    let mut entries = HashMap::new();
+    for result in reader.deserialize() {
+        let entry: ManifestEntry = result?;
+        entries.insert(entry.id, entry);
+    }
+    Ok(entries)
+}
+
+/// Write the manifest sorted by ID, replacing the old one atomically.
+pub fn write_manifest(path: &Path, entries: &HashMap<i32, ManifestEntry>) -> Result<()> {
+    let part = part_path(path);
+    let mut ids: Vec<i32> = entries.keys().copied().collect();
+    ids.sort_unstable();
+
+    let mut writer = csv::Writer::from_path(&part)?;
+    for id in ids {
+        writer.serialize(&entries[&id])?;
+    }
+    writer.flush()?;
+    drop(writer);
+    std::fs::rename(&part, path)?;
+    Ok(())
+}
+
+/// Write object IDs one per line, sorted, replacing the old file atomically.
+pub fn write_ids(path: &Path, ids: &[i32]) -> Result<()> {
+    let mut ids = ids.to_vec();
+    ids.sort_unstable();
+    let body: String = ids.iter().map(|id| format!("{}\n", id)).collect();
+    let part = part_path(path);
+    std::fs::write(&part, body)?;
+    std::fs::rename(&part, path)?;
+    Ok(())
+}
+
+/// What `download_list.py` records next to the CSV it writes
+/// (`art.csv` -> `art.json`).
+#[derive(Debug, serde::Deserialize)]
+pub struct ListInfo {
+    /// False when filters left out IDs that are still in the collection
+    pub complete: bool,
+    #[serde(default)]
+    pub filters: Vec<String>,
+}
+
+/// Read the list description for `input`, if there is one. Hand-made CSVs
+/// without it are taken to be complete.
+pub fn read_list_info(input: &Path) -> Result<Option<ListInfo>> {
+    let path = input.with_extension("json");
+    if !path.exists() {
+        return Ok(None);
+    }
+    Ok(Some(serde_json::from_slice(&std::fs::read(path)?)?))
+}
@@ -0,0 +1,242 @@
+//! Per-request metrics and the JSON report written at the end of a run.
+
+use std::collections::BTreeMap;
+use std::path::Path;
+use std::sync::Mutex;
+use std::time::{Duration, Instant};
+
+use anyhow::Result;
+use serde::Serialize;
+
+/// Upper bounds of the latency buckets, in milliseconds
+const LATENCY_BOUNDS: &[u64] = &[
+    10, 25, 50, 100, 250, 500, 1_000, 2_500, 5_000, 10_000, 30_000,
+];
+/// Upper bounds of the size buckets, in bytes
+const SIZE_BOUNDS: &[u64] = &[
+    4 << 10,
+    8 << 10,
+    16 << 10,
+    32 << 10,
+    64 << 10,
+    128 << 10,
+    256 << 10,
+    512 << 10,
+    1 << 20,
+    4 << 20,
+];
+/// Width of the throughput intervals
+const INTERVAL: Duration = Duration::from_secs(10);
+
+/// Fixed-bucket histogram; the last bucket counts values above every bound.
+struct Histogram {
+    bounds: &'static [u64],
+    counts: Vec<u64>,
+    sum: u64,
+    max: u64,
+}
+
+#[derive(Serialize)]
+struct Bucket {
+    /// Inclusive upper bound, `None` for the overflow bucket
+    le: Option<u64>,
+    count: u64,
+}
+
+#[derive(Serialize)]
+struct HistogramReport {
+    count: u64,
+    mean: f64,
+    /// Percentiles are bucket upper bounds (or the max, past the last bound)
+    p50: u64,
+    p90: u64,
+    p99: u64,
+    max: u64,
+    buckets: Vec<Bucket>,
+}
+
+impl Histogram {
+    fn new(bounds: &'static [u64]) -> Self {
+        Self {
+            bounds,
+            counts: vec![0; bounds.len() + 1],
+            sum: 0,
+            max: 0,
+        }
+    }
+
+    fn record(&mut self, value: u64) {
+        let bucket = self.bounds.partition_point(|&bound| bound < value);
+        self.counts[bucket] += 1;
+        self.sum += value;
+        self.max = self.max.max(value);
+    }
+
+    fn percentile(&self, q: f64) -> u64 {
+        let total: u64 = self.counts.iter().sum();
+        let rank = (q * total as f64).ceil().max(1.0) as u64;
+        let mut seen = 0;
+        for (bucket, count) in self.counts.iter().enumerate() {
+            seen += count;
+            if seen >= rank {
+                return self
+                    .bounds
+                    .get(bucket)
+                    .map_or(self.max, |&b| b.min(self.max));
+            }
+        }
+        self.max
+    }
+
+    fn report(&self) -> HistogramReport {
+        let count: u64 = self.counts.iter().sum();
+        HistogramReport {
+            count,
+            mean: if count > 0 {
+                self.sum as f64 / count as f64
+            } else {
+                0.0
+            },
+            p50: self.percentile(0.5),
+            p90: self.percentile(0.9),
+            p99: self.percentile(0.99),
+            max: self.max,
+            buckets: self
+                .counts
+                .iter()
+                .enumerate()
+                .map(|(bucket, &count)| Bucket {
+                    le: self.bounds.get(bucket).copied(),
+                    count,
+                })
+                .collect(),
+        }
+    }
+}
+
+#[derive(Clone, Default, Serialize)]
+struct Interval {
+    /// Seconds since the start of the run
+    start: u64,
+    completed: u64,
+    bytes: u64,
+}
+
+#[derive(Serialize)]
+pub struct Failure {
+    pub id: i32,
+    pub url: String,
+    pub reason: String,
+}
+
+struct MetricsState {
+    latency: Histogram,
+    size: Histogram,
+    status_codes: BTreeMap<String, u64>,
+    timeline: Vec<Interval>,
+    failures: Vec<Failure>,
+}
+
+pub struct Metrics {
+    started: Instant,
+    state: Mutex<MetricsState>,
+}
+
+impl Metrics {
+    pub fn new() -> Self {
+        Self {
+            started: Instant::now(),
+            state: Mutex::new(MetricsState {
+                latency: Histogram::new(LATENCY_BOUNDS),
+                size: Histogram::new(SIZE_BOUNDS),
+                status_codes: BTreeMap::new(),
+                timeline: Vec::new(),
+                failures: Vec::new(),
+            }),
+        }
+    }
+
+    /// An HTTP response arrived after `latency` (time to headers).
+    pub fn record_response(&self, status: u16, latency: Duration) {
+        let mut state = self.state.lock().unwrap();
+        state.latency.record(latency.as_millis() as u64);
+        *state.status_codes.entry(status.to_string()).or_default() += 1;
+    }
+
+    /// A request failed without a response.
+    pub fn record_error(&self, error: &reqwest::Error) {
+        let kind = if error.is_timeout() {
+            "timeout"
+        } else if error.is_connect() {
+            "connect"
+        } else {
+            "request"
+        };
+        let mut state = self.state.lock().unwrap();
+        *state
+            .status_codes
+            .entry(format!("error:{}", kind))
+            .or_default() += 1;
+    }
+
+    /// A record finished (downloaded, unchanged or failed), having
+    /// transferred `bytes` of image data.
+    pub fn record_completion(&self, bytes: Option<u64>) {
+        let interval = (self.started.elapsed().as_secs() / INTERVAL.as_secs()) as usize;
+        let mut state = self.state.lock().unwrap();
+        if let Some(bytes) = bytes {
+            state.size.record(bytes);
+        }
+        if state.timeline.len() <= interval {
+            state.timeline.resize(interval + 1, Interval::default());
+        }
+        let slot = &mut state.timeline[interval];
+        slot.completed += 1;
+        slot.bytes += bytes.unwrap_or(0);
+    }
+
+    pub fn record_failure(&self, failure: Failure) {
+        self.state.lock().unwrap().failures.push(failure);
+    }
+
+    /// Write everything recorded, plus the caller's `summary`, as JSON.
+    pub fn write_report(&self, path: &Path, summary: impl Serialize) -> Result<()> {
+        #[derive(Serialize)]
+        struct Report<'a, S> {
+            elapsed_secs: f64,
+            #[serde(flatten)]
+            summary: S,
+            status_codes: &'a BTreeMap<String, u64>,
+            latency_ms: HistogramReport,
+            size_bytes: HistogramReport,
+            /// Completions per `interval_secs` window
+            interval_secs: u64,
+            throughput: Vec<Interval>,
+            failed: &'a [Failure],
+        }
+
+        let state = self.state.lock().unwrap();
+        let throughput = state
+            .timeline
+            .iter()
+            .enumerate()
+            .map(|(i, slot)| Interval {
+                start: i as u64 * INTERVAL.as_secs(),
+                ..slot.clone()
+            })
+            .collect();
+        let report = Report {
+            elapsed_secs: self.started.elapsed().as_secs_f64(),
+            summary,
+            status_codes: &state.status_codes,
+            latency_ms: state.latency.report(),
+            size_bytes: state.size.report(),
+            interval_secs: INTERVAL.as_secs(),
+            throughput,
+            failed: &state.failures,
+        };
+        let file = std::fs::File::create(path)?;
+        serde_json::to_writer_pretty(std::io::BufWriter::new(file), &report)?;
+        Ok(())
+    }
+}
@@ -0,0 +1,183 @@
+//! Pack downloads into tar shards with an index of where each image lives.
+//!
+//! Shards are plain (ustar) tar files named `shard-NNNNNN.tar` in the output
+//! directory, so they can be inspected with `tar -tf` or read as a
+//! WebDataset. `index.csv` maps each object ID to its shard and the byte
+//! range of the image inside it; rows are appended when a shard is closed,
+//! and a later row for the same ID wins.
+
+use std::collections::HashSet;
+use std::fs::{File, OpenOptions};
+use std::io::BufWriter;
+use std::path::{Path, PathBuf};
+use std::sync::{Arc, Mutex};
+
+use anyhow::{Context, Result};
+
+use crate::part_path;
+
+const BLOCK: u64 = 512;
+
+#[derive(Debug, serde::Serialize, serde::Deserialize)]
+pub struct IndexEntry {
+    pub id: i32,
+    pub shard: String,
+    /// Byte offset of the image data (not the tar header) in the shard
+    pub offset: u64,
+    pub length: u64,
+}
+
+struct OpenShard {
+    name: String,
+    builder: tar::Builder<BufWriter<File>>,
+    entries: Vec<IndexEntry>,
+    size: u64,
+}
+
+struct ShardState {
+    next: u32,
+    current: Option<OpenShard>,
+    stored: HashSet<i32>,
+}
+
+pub struct ShardWriter {
+    dir: PathBuf,
+    max_bytes: u64,
+    /// Extension of the member names, e.g. `jpg` for `12345.jpg`
+    extension: &'static str,
+    state: Mutex<ShardState>,
+}
+
+impl ShardWriter {
+    /// Open `dir` for appending. Existing shards are never modified; new
+    /// images go into shards numbered after the last one.
+    pub fn open(dir: &Path, max_bytes: u64, extension: &'static str) -> Result<Self> {
+        std::fs::create_dir_all(dir).context("Failed to create shard directory")?;
+        let stored = read_index(&dir.join("index.csv"))?
+            .into_iter()
+            .map(|entry| entry.id)
+            .collect();
+        let next = std::fs::read_dir(dir)?
+            .filter_map(|entry| shard_number(&entry.ok()?.path()))
+            .max()
+            .map_or(0, |n| n + 1);
+        Ok(Self {
+            dir: dir.to_path_buf(),
+            max_bytes,
+            extension,
+            state: Mutex::new(ShardState {
+                next,
+                current: None,
+                stored,
+            }),
+        })
+    }
+
+    pub fn dir(&self) -> &Path {
+        &self.dir
+    }
+
+    /// Whether `id` is in a closed shard (from this or an earlier run).
+    pub fn contains(&self, id: i32) -> bool {
+        self.state.lock().unwrap().stored.contains(&id)
+    }
+
+    /// Append an image to the open shard, off the async runtime.
+    pub async fn store(self: &Arc<Self>, id: i32, data: Vec<u8>) -> Result<()> {
+        let this = Arc::clone(self);
+        tokio::task::spawn_blocking(move || this.append(id, &data)).await?
+    }
+
+    fn append(&self, id: i32, data: &[u8]) -> Result<()> {
+        let mut state = self.state.lock().unwrap();
+        if state.current.is_none() {
+            let name = format!("shard-{:06}.tar", state.next);
+            let file = File::create(part_path(&self.dir.join(&name)))?;
+            state.next += 1;
+            state.current = Some(OpenShard {
+                name,
+                builder: tar::Builder::new(BufWriter::new(file)),
+                entries: Vec::new(),
+                size: 0,
+            });
+        }
+
+        let shard = state.current.as_mut().unwrap();
+        let mut header = tar::Header::new_ustar();
+        header.set_path(format!("{}.{}", id, self.extension))?;
+        header.set_size(data.len() as u64);
+        header.set_mode(0o644);
+        header.set_mtime(crate::manifest::now());
+        header.set_cksum();
+        shard.builder.append(&header, data)?;
+
+        shard.entries.push(IndexEntry {
+            id,
+            shard: shard.name.clone(),
+            offset: shard.size + BLOCK,
+            length: data.len() as u64,
+        });
+        shard.size += BLOCK + (data.len() as u64).div_ceil(BLOCK) * BLOCK;
+
+        if shard.size >= self.max_bytes {
+            self.close(&mut state)?;
+        }
+        Ok(())
+    }
+
+    /// Close the open shard, if any. Call once all downloads are done.
+    pub fn finish(&self) -> Result<()> {
+        let mut state = self.state.lock().unwrap();
+        self.close(&mut state)
+    }
+
+    /// Finish the tar, rename it into place, then append its entries to the
+    /// index, so the index only ever points at complete shards.
+    fn close(&self, state: &mut ShardState) -> Result<()> {
+        let Some(shard) = state.current.take() else {
+            return Ok(());
+        };
+        let path = self.dir.join(&shard.name);
+        let file = shard
+            .builder
+            .into_inner()?
+            .into_inner()
+            .map_err(|e| e.into_error())?;
+        file.sync_data()?;
+        drop(file);
+        std::fs::rename(part_path(&path), &path)?;
+
+        let index_path = self.dir.join("index.csv");
+        let is_new = !index_path.exists();
+        let file = OpenOptions::new()
+            .create(true)
+            .append(true)
+            .open(&index_path)?;
+        let mut writer = csv::WriterBuilder::new()
+            .has_headers(is_new)
+            .from_writer(file);
+        for entry in &shard.entries {
+            writer.serialize(entry)?;
+            state.stored.insert(entry.id);
+        }
+        writer.flush()?;
+        Ok(())
+    }
+}
+
+pub fn read_index(path: &Path) -> Result<Vec<IndexEntry>> {
+    if !path.exists() {
+        return Ok(Vec::new());
+    }
+    let mut reader = csv::Reader::from_path(path)?;
+    let mut entries = Vec::new();
+    for result in reader.deserialize() {
+        entries.push(result?);
+    }
+    Ok(entries)
+}
+
+fn shard_number(path: &Path) -> Option<u32> {
+    let name = path.file_name()?.to_str()?;
+    name.strip_prefix("shard-")?.split('.').next()?.parse().ok()
+}
@@ -0,0 +1,79 @@
+//! Optional resize and center-crop applied to images as they are downloaded.
+
+use std::io::Cursor;
+
+use anyhow::Result;
+use image::codecs::jpeg::JpegEncoder;
+use image::imageops::{self, FilterType};
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq, clap::ValueEnum)]
+pub enum StoreFormat {
+    /// Re-encoded JPEG
+    Jpeg,
+    /// Raw `crop x crop x 3` RGB bytes, no header
+    Raw,
+}
+
+impl StoreFormat {
+    pub fn extension(self) -> &'static str {
+        match self {
+            StoreFormat::Jpeg => "jpg",
+            StoreFormat::Raw => "rgb",
+        }
+    }
+}
+
+/// Mirrors an image processor's resize-then-center-crop (DINOv2: shorter
+/// side to 256, crop 224), so embed.py sees the same pixels either way.
+#[derive(Debug, Clone, Copy)]
+pub struct Transform {
+    /// Length of the shorter side after resizing
+    pub resize: u32,
+    /// Side of the square center crop, at most `resize`
+    pub crop: u32,
+    pub format: StoreFormat,
+    pub quality: u8,
+}
+
+impl Transform {
+    /// Decode `data`, resize its shorter side to `resize`, center-crop to
+    /// `crop x crop`, and encode it in the store format.
+    pub fn apply(&self, data: &[u8]) -> Result<Vec<u8>> {
+        let image = image::load_from_memory(data)?.to_rgb8();
+        let (width, height) = image.dimensions();
+        let scale = self.resize as f64 / width.min(height) as f64;
+        let width = ((width as f64 * scale).round() as u32).max(self.resize);
+        let height = ((height as f64 * scale).round() as u32).max(self.resize);
+        let resized = imageops::resize(&image, width, height, FilterType::CatmullRom);
+        let cropped = imageops::crop_imm(
+            &resized,
+            (width - self.crop) / 2,
+            (height - self.crop) / 2,
+            self.crop,
+            self.crop,
+        )
+        .to_image();
+
+        match self.format {
+            StoreFormat::Raw => Ok(cropped.into_raw()),
+            StoreFormat::Jpeg => {
+                let mut buffer = Cursor::new(Vec::new());
+                JpegEncoder::new_with_quality(&mut buffer, self.quality).encode_image(&cropped)?;
+                Ok(buffer.into_inner())
+            }
+        }
+    }
+
+    /// Description for embed.py, written to `<output>/preprocess.json`.
+    /// `size` is the side of the stored images.
+    pub fn describe(&self) -> String {
+        let format = match self.format {
+            StoreFormat::Jpeg => "jpeg",
+            StoreFormat::Raw => "raw",
+        };
+        format!(
+            "{{\"resize\": {}, \"size\": {}, \"format\": \"{}\"}}\n",
+            self.resize, self.crop, format
+        )
+    }
+}
@@ -0,0 +1,171 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "httpx",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Exercise image_proxy.py against a local stand-in IIIF server.
+"""
+
+import collections
+import json
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+import image_proxy
+
+
+class Upstream:
+    """A threaded HTTP server serving fake JPEGs with ETags, counting requests."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = collections.Counter()
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with upstream._lock:
+                    upstream.requests[self.path] += 1
+                time.sleep(upstream.delay)
+                etag = f'"{self.path}"'
+                if self.headers.get("If-None-Match") == etag:
+                    with upstream._lock:
+                        upstream.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = b"\xff\xd8" + self.path.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, object_id: int) -> str:
+        return f"http://{self.host}/iiif/{object_id}/full/!200,200/0/default.jpg"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ImageProxyTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.upstream = Upstream()
+        self.client = httpx.Client(timeout=10)
+
+    def tearDown(self):
+        self.client.close()
+        self.upstream.close()
+
+    def make_proxy(self, *, online=True, max_age=3600.0, local_files=None):
+        return image_proxy.ImageProxy(
+            image_proxy.DiskCache(self.tmp / "cache", 1 << 20),
+            self.client if online else None,
+            max_age=max_age,
+            local_files=local_files or {},
+        )
+
+    def test_cache_hit(self):
+        proxy = self.make_proxy()
+        url = self.upstream.url(1)
+        first = proxy.fetch(url)
+        second = proxy.fetch(url)
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], 200)
+        self.assertEqual(sum(self.upstream.requests.values()), 1)
+
+    def test_concurrent_requests_share_one_fetch(self):
+        self.upstream.delay = 0.2
+        proxy = self.make_proxy()
+        url = self.upstream.url(2)
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: proxy.fetch(url), range(8)))
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(sum(self.upstream.requests.values()), 1)
+
+    def test_stale_entry_is_revalidated(self):
+        proxy = self.make_proxy(max_age=0)
+        url = self.upstream.url(3)
+        first = proxy.fetch(url)
+        second = proxy.fetch(url)
+        self.assertEqual(first, second)
+        self.assertEqual(sum(self.upstream.requests.values()), 2)
+        self.assertEqual(self.upstream.not_modified, 1)
+
+    def test_offline_serves_only_cached(self):
+        url = self.upstream.url(4)
+        self.make_proxy().fetch(url)
+        # even a stale entry is served when offline
+        proxy = self.make_proxy(online=False, max_age=0)
+        self.assertEqual(proxy.fetch(url)[0], 200)
+        self.assertEqual(proxy.fetch(self.upstream.url(5))[0], 504)
+        self.assertEqual(sum(self.upstream.requests.values()), 1)
+
+    def test_through_http_handler(self):
+        proxy = self.make_proxy()
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            image_proxy.make_handler(proxy, {self.upstream.host}),
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            base = f"http://127.0.0.1:{server.server_port}"
+            url = self.upstream.url(6)
+            response = self.client.get(f"{base}/{url.replace('://', '/', 1)}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["content-type"], "image/jpeg")
+            blocked = self.client.get(f"{base}/https/example.com/image.jpg")
+            self.assertEqual(blocked.status_code, 403)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_local_files(self):
+        images = self.tmp / "images"
+        images.mkdir()
+        (images / "7.jpg").write_bytes(b"local")
+        index = self.tmp / "art.csv"
+        url = self.upstream.url(7)
+        index.write_text(f'objectid,thumburl\n7,"{url}"\n')
+
+        local_files = image_proxy.read_local_files(index, images)
+        proxy = self.make_proxy(online=False, local_files=local_files)
+        self.assertEqual(proxy.fetch(url), (200, b"local", "image/jpeg"))
+
+        # resized downloads are crops, not the thumbnails the URLs name
+        (images / "preprocess.json").write_text(json.dumps({"size": 224}))
+        self.assertEqual(image_proxy.read_local_files(index, images), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
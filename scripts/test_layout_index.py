@@ -0,0 +1,73 @@
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "marimo",
+#     "numpy",
+#     "polars",
+#     "scipy",
+# ]
+#
+# [tool.uv]
+# exclude-newer = "2025-12-09T06:40:36.036728-08:00"
+# ///
+"""
+Check 02_explore.py's LayoutIndex region queries against brute force.
+"""
+
+import unittest
+
+import numpy as np
+import polars as pl
+
+from notebook_module import load_notebook
+
+_, defs = load_notebook("02_explore").layout_index.run(np=np)
+LayoutIndex = defs["LayoutIndex"]
+
+
+def brute_rectangle(points: np.ndarray, x0, y0, x1, y1) -> np.ndarray:
+    (x0, x1), (y0, y1) = sorted((x0, x1)), sorted((y0, y1))
+    x, y = points.T
+    inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+    return np.flatnonzero(inside).astype(np.uint32)
+
+
+class LayoutIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # rounded so that many points share an x or y with a rectangle edge
+        points = rng.integers(0, 50, size=(5000, 2)) / 2
+        self.index = LayoutIndex(pl.DataFrame({"x": points[:, 0], "y": points[:, 1]}))
+        self.points = self.index.points
+
+    def assert_rectangle(self, x0, y0, x1, y1):
+        rows = self.index.rectangle(x0, y0, x1, y1)
+        self.assertEqual(rows.dtype, np.uint32)
+        np.testing.assert_array_equal(
+            rows, brute_rectangle(self.points, x0, y0, x1, y1)
+        )
+
+    def test_rectangle(self):
+        rng = np.random.default_rng(1)
+        for x0, y0, x1, y1 in rng.uniform(-2, 27, size=(50, 4)):
+            self.assert_rectangle(x0, y0, x1, y1)
+        self.assert_rectangle(3, 4, 12.5, 20)
+        self.assert_rectangle(-10, -10, 100, 100)
+        self.assert_rectangle(100, 100, 200, 200)
+
+    def test_degenerate_rectangle(self):
+        # zero-width and zero-height spans are closed intervals
+        self.assert_rectangle(7.5, 2, 7.5, 19)
+        self.assert_rectangle(1, 11, 23, 11)
+        self.assert_rectangle(4, 4, 4, 4)
+        self.assertGreater(len(self.index.rectangle(7.5, 0, 7.5, 25)), 0)
+
+    def test_polygon_matches_rectangle(self):
+        square = [(2.2, 3.3), (9.1, 3.3), (9.1, 8.7), (2.2, 8.7)]
+        np.testing.assert_array_equal(
+            self.index.polygon(square), self.index.rectangle(2.2, 3.3, 9.1, 8.7)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -45,8 +45,13 @@ def main() -> None:
     config = {"perplexity": 50, "learning_rate": "auto"}
     print(f"Running t-SNE with {config}")
 
+    # identical embeddings (duplicate images) share one point instead of
+    # forming an artificial cluster
+    X_unique, inverse = np.unique(X, axis=0, return_inverse=True)
+    print(f"{len(X) - len(X_unique)} duplicate embeddings share a point")
+
     tsne = TSNE(n_components=2, random_state=42, **config)
-    X_transformed = tsne.fit_transform(X)
+    X_transformed = tsne.fit_transform(X_unique)[inverse.ravel()]
 
     (
         pl.DataFrame(